@@ -2,128 +2,306 @@
 Система индексации документов для поиска
 """
 
-from typing import Dict, List, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 from collections import defaultdict, Counter
+from operator import itemgetter, mul
+from array import array
+import heapq
 import math
+import threading
 from core.text_processor import TextProcessor
 
 
+def _vector_norm(vector: Dict[int, float]) -> float:
+    """L2-норма разреженного вектора (свертка выполняется в C через map/sum)"""
+    weights = vector.values()
+    return math.sqrt(sum(map(mul, weights, weights)))
+
+
+def _sparse_dot(vec1: Dict[int, float], vec2: Dict[int, float]) -> float:
+    """Скалярное произведение разреженных векторов"""
+    # Проходим меньший вектор и проверяем слова в большем, без построения множеств
+    if len(vec1) > len(vec2):
+        vec1, vec2 = vec2, vec1
+    
+    dot_product = 0.0
+    get_weight = vec2.get
+    for word_id, weight in vec1.items():
+        other_weight = get_weight(word_id)
+        if other_weight is not None:
+            dot_product += weight * other_weight
+    
+    return dot_product
+
+
 class DocumentIndex:
     """Класс для индексации документов"""
     
-    def __init__(self):
+    SCORE_MODES = ('cosine', 'bm25')
+    
+    def __init__(self, approximate_threshold: int = 5000, max_postings_per_term: int = 1000,
+                 score_mode: str = 'cosine', k1: float = 1.5, b: float = 0.75):
+        if score_mode not in self.SCORE_MODES:
+            raise ValueError(f"Неизвестный режим ранжирования: {score_mode}")
+        
         self.text_processor = TextProcessor()
         
-        # Инвертированный индекс: слово -> {doc_id: tf}
-        self.inverted_index: Dict[str, Dict[str, int]] = defaultdict(dict)
+        # Режим ранжирования: косинусное сходство TF-IDF или BM25 (с параметрами k1, b)
+        self.score_mode = score_mode
+        self.k1 = k1
+        self.b = b
+        
+        # Начиная с approximate_threshold документов поиск становится приближенным:
+        # по каждому слову запроса просматриваются только max_postings_per_term
+        # вхождений с наибольшими весами
+        self.approximate_threshold = approximate_threshold
+        self.max_postings_per_term = max_postings_per_term
+        
+        # Словарь: слово -> целочисленный идентификатор слова (word_id).
+        # Все остальные структуры индекса используют word_id вместо строк
+        self.vocab: Dict[str, int] = {}
         
-        # Прямой индекс: doc_id -> {слово: tf}
-        self.forward_index: Dict[str, Dict[str, int]] = defaultdict(dict)
+        # Обратный словарь: word_id -> слово
+        self.inv_vocab: List[str] = []
+        
+        # Номера строк документов: doc_idx -> doc_id (None - строка освобождена).
+        # Все остальные структуры индекса используют doc_idx вместо строковых doc_id
+        self.doc_ids: List[Optional[str]] = []
+        
+        # Обратное отображение: doc_id -> doc_idx
+        self.doc_id_to_idx: Dict[str, int] = {}
+        
+        # Освобожденные номера строк удаленных документов
+        self._free_doc_indices: List[int] = []
+        
+        # Инвертированный индекс: word_id -> {doc_idx: tf}
+        self.inverted_index: Dict[int, Dict[int, int]] = defaultdict(dict)
+        
+        # Прямой индекс: doc_idx -> {word_id: tf}
+        self.forward_index: Dict[int, Dict[int, int]] = defaultdict(dict)
         
         # Общее количество документов
         self.total_documents = 0
         
-        # Общее количество слов в каждом документе
-        self.document_lengths: Dict[str, int] = {}
+        # Общее количество слов в каждом документе (по doc_idx)
+        self.document_lengths: Dict[int, int] = {}
         
-        # TF-IDF веса для каждого слова в каждом документе
-        self.tf_idf_weights: Dict[str, Dict[str, float]] = defaultdict(dict)
+        # TF-IDF веса для каждого слова в каждом документе (по doc_idx)
+        self.tf_idf_weights: Dict[int, Dict[int, float]] = defaultdict(dict)
         
-        # Кэш для IDF значений
-        self.idf_cache: Dict[str, float] = {}
-    
-    def add_document(self, doc_id: str, content: str):
-        """Добавление документа в индекс"""
-        # Обрабатываем текст
-        processed_text = self.text_processor.preprocess_text(content)
+        # Документная частота слов: df[word_id] - число документов со словом
+        self.df = array('i')
+        
+        # IDF значения, индексированные word_id; пересчитываются целиком
+        # при первом обращении после изменения индекса
+        self.idf: List[float] = []
+        self._idf_dirty = False
+        
+        # Кэш норм TF-IDF векторов документов (по doc_idx)
+        self.doc_norms: Dict[int, float] = {}
+        
+        # L2-нормированные TF-IDF веса по словам: word_id -> (doc_idx документов, веса)
+        # (разреженная матрица документы x словарь, хранимая по столбцам;
+        # веса упакованы в float32-массив вместо отдельных объектов float
+        # и упорядочены по убыванию). В режиме bm25 здесь хранятся BM25-вклады слов
+        # в документы, уже учитывающие длину документа
+        self.normalized_postings: Dict[int, Tuple[array, array]] = {}
+        
+        # Максимальный нормированный вес слова по всем документам
+        # (верхняя граница вклада слова в сходство, используется для отсечения MaxScore)
+        self.term_max_contrib: Dict[int, float] = {}
         
-        if not processed_text:
+        # Параметры BM25: средняя длина документа и знаменатели k1*(1-b+b*dl/avgdl)
+        self.avgdl = 0.0
+        self.doc_norm_bm25: Dict[int, float] = {}
+        
+        # Флаг необходимости перестроения TF-IDF весов, норм и нормированных весов
+        # и номер изменения индекса (веса, построенные до изменения, не публикуются)
+        self._weights_dirty = True
+        self._version = 0
+        
+        # Переиспользуемый плотный массив накопленных оценок (по doc_idx);
+        # после каждого запроса обнуляются только затронутые элементы
+        self._scores: List[float] = []
+        
+        # Блокировка состояния индекса: изменения документов, пересчет IDF и весов
+        # (может идти в фоновом потоке) и поиск по ним не пересекаются.
+        # Блокировка повторно входимая: пересчет весов пересчитывает и IDF
+        self._rebuild_lock = threading.RLock()
+    
+    def add_document(self, doc_id: str, content: str, tokens: Optional[Sequence[str]] = None):
+        """
+        Добавление документа в индекс
+        
+        Args:
+            doc_id: Идентификатор документа
+            content: Исходный текст документа
+            tokens: Уже обработанные слова документа; если переданы,
+                повторная обработка и разбиение текста не выполняются
+        """
+        if tokens is None:
+            # Обрабатываем текст и разбиваем на слова
+            tokens = self.text_processor.preprocess_text(content).split()
+        
+        if not tokens:
             return
         
-        # Разбиваем на слова
-        words = processed_text.split()
+        # Изменения индекса не пересекаются с фоновым пересчетом весов
+        with self._rebuild_lock:
+            self._add_document(doc_id, tokens)
+    
+    def _add_document(self, doc_id: str, words: Sequence[str]):
+        # Повторное добавление документа заменяет его прежнюю версию
+        if doc_id in self.doc_id_to_idx:
+            self._remove_document(doc_id)
         
-        # Подсчитываем частоту слов в документе
+        # Подсчитываем частоту слов в документе (Counter считает в C)
         word_counts = Counter(words)
         
-        # Обновляем индексы
+        # Переводим слова в word_id (новые слова получают следующий номер)
+        vocab = self.vocab
+        word_id_counts = {}
         for word, count in word_counts.items():
-            # Обновляем инвертированный индекс
-            self.inverted_index[word][doc_id] = count
-            
-            # Обновляем прямой индекс
-            self.forward_index[doc_id][word] = count
+            word_id = vocab.get(word)
+            if word_id is None:
+                word_id = vocab[word] = len(self.inv_vocab)
+                self.inv_vocab.append(word)
+                self.df.append(0)
+            word_id_counts[word_id] = count
+        
+        doc_idx = self._allocate_doc_idx(doc_id)
+        
+        # Прямой индекс заполняется одним присваиванием
+        self.forward_index[doc_idx] = word_id_counts
+        
+        # Обновляем инвертированный индекс
+        inverted_index = self.inverted_index
+        df = self.df
+        for word_id, count in word_id_counts.items():
+            inverted_index[word_id][doc_idx] = count
+            df[word_id] += 1
+        
+        # Длина документа равна числу слов, повторное суммирование не нужно
+        self.document_lengths[doc_idx] = len(words)
+        
+        # Инвалидируем IDF и нормированные веса (пересчет - при первом запросе)
+        self._idf_dirty = True
+        self._weights_dirty = True
+        self._version += 1
+        self.total_documents += 1
+    
+    def add_documents(self, documents: Iterable[Tuple]):
+        """
+        Пакетное добавление документов в индекс
         
-        # Обновляем длину документа
-        self.document_lengths[doc_id] = sum(word_counts.values())
+        Args:
+            documents: Кортежи (doc_id, content) или (doc_id, content, tokens)
         
-        # Инвалидируем кэш IDF
-        self.idf_cache.clear()
+        IDF, веса и нормы пересчитываются один раз при первом запросе после добавления.
+        """
+        for document in documents:
+            self.add_document(*document)
+    
+    def _allocate_doc_idx(self, doc_id: str) -> int:
+        """Выделение номера строки для документа (освобожденные номера переиспользуются)"""
+        if self._free_doc_indices:
+            doc_idx = self._free_doc_indices.pop()
+            self.doc_ids[doc_idx] = doc_id
+        else:
+            doc_idx = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self._scores.append(0.0)
         
-        # Обновляем общее количество документов
-        self.total_documents = len(self.forward_index)
+        self.doc_id_to_idx[doc_id] = doc_idx
+        return doc_idx
     
     def remove_document(self, doc_id: str):
         """Удаление документа из индекса"""
-        if doc_id not in self.forward_index:
+        with self._rebuild_lock:
+            self._remove_document(doc_id)
+    
+    def _remove_document(self, doc_id: str):
+        doc_idx = self.doc_id_to_idx.pop(doc_id, None)
+        if doc_idx is None:
             return
         
+        # Освобождаем номер строки
+        self.doc_ids[doc_idx] = None
+        self._free_doc_indices.append(doc_idx)
+        
         # Удаляем из прямого индекса
-        words = list(self.forward_index[doc_id].keys())
-        del self.forward_index[doc_id]
+        word_ids = list(self.forward_index.pop(doc_idx).keys())
         
         # Удаляем из инвертированного индекса
-        for word in words:
-            if doc_id in self.inverted_index[word]:
-                del self.inverted_index[word][doc_id]
+        for word_id in word_ids:
+            if doc_idx in self.inverted_index[word_id]:
+                del self.inverted_index[word_id][doc_idx]
+                self.df[word_id] -= 1
                 # Если слово больше не встречается ни в одном документе, удаляем его
-                if not self.inverted_index[word]:
-                    del self.inverted_index[word]
+                # (word_id в словаре сохраняется)
+                if not self.inverted_index[word_id]:
+                    del self.inverted_index[word_id]
         
         # Удаляем длину документа
-        if doc_id in self.document_lengths:
-            del self.document_lengths[doc_id]
-        
-        # Удаляем TF-IDF веса
-        if doc_id in self.tf_idf_weights:
-            del self.tf_idf_weights[doc_id]
+        self.document_lengths.pop(doc_idx, None)
         
-        # Инвалидируем кэш IDF
-        self.idf_cache.clear()
+        # Удаляем TF-IDF веса и норму документа
+        self.tf_idf_weights.pop(doc_idx, None)
+        self.doc_norms.pop(doc_idx, None)
         
-        # Обновляем общее количество документов
-        self.total_documents = len(self.forward_index)
+        # Инвалидируем IDF и нормированные веса
+        self._idf_dirty = True
+        self._weights_dirty = True
+        self._version += 1
+        self.total_documents -= 1
+    
+    def has_word(self, word: str) -> bool:
+        """Проверка, встречается ли слово хотя бы в одном документе"""
+        word_id = self.vocab.get(word)
+        return word_id is not None and self.df[word_id] > 0
     
     def calculate_tf(self, word: str, doc_id: str) -> float:
         """Вычисление TF (Term Frequency)"""
-        if doc_id not in self.forward_index or word not in self.forward_index[doc_id]:
+        word_id = self.vocab.get(word)
+        doc_idx = self.doc_id_to_idx.get(doc_id)
+        if doc_idx is None or word_id not in self.forward_index[doc_idx]:
             return 0.0
         
-        word_count = self.forward_index[doc_id][word]
-        doc_length = self.document_lengths.get(doc_id, 1)
+        word_count = self.forward_index[doc_idx][word_id]
+        doc_length = self.document_lengths.get(doc_idx, 1)
         
         # Нормализованный TF
         return word_count / doc_length
     
     def calculate_idf(self, word: str) -> float:
         """Вычисление IDF (Inverse Document Frequency)"""
-        if word in self.idf_cache:
-            return self.idf_cache[word]
-        
-        if word not in self.inverted_index:
+        word_id = self.vocab.get(word)
+        if word_id is None:
             return 0.0
         
-        # Количество документов, содержащих это слово
-        doc_frequency = len(self.inverted_index[word])
-        
-        # IDF = log(total_documents / doc_frequency)
-        if doc_frequency == 0:
-            idf = 0.0
-        else:
-            idf = math.log(self.total_documents / doc_frequency)
+        return self._calculate_idf_by_id(word_id)
+    
+    def _calculate_idf_by_id(self, word_id: int) -> float:
+        """Вычисление IDF по word_id"""
+        self._refresh_idf_if_dirty()
+        return self.idf[word_id]
+    
+    def _refresh_idf_if_dirty(self):
+        """Пересчет всех IDF значений одним проходом по документным частотам"""
+        if not self._idf_dirty:
+            return
         
-        self.idf_cache[word] = idf
-        return idf
+        # Пересчет идет под блокировкой изменений: иначе добавление документа во время
+        # пересчета оставило бы idf короче df при сброшенном флаге
+        with self._rebuild_lock:
+            if not self._idf_dirty:
+                return
+            
+            # IDF = log(total_documents / doc_frequency)
+            log = math.log
+            total_documents = self.total_documents
+            self.idf = [log(total_documents / df) if df else 0.0 for df in self.df]
+            self._idf_dirty = False
     
     def calculate_tf_idf(self, word: str, doc_id: str) -> float:
         """Вычисление TF-IDF"""
@@ -131,95 +309,371 @@ class DocumentIndex:
         idf = self.calculate_idf(word)
         return tf * idf
     
-    def get_document_vector(self, doc_id: str) -> Dict[str, float]:
-        """Получение вектора документа (TF-IDF веса для всех слов)"""
-        if doc_id not in self.forward_index:
+    def get_document_vector(self, doc_id: str) -> Dict[int, float]:
+        """Получение вектора документа (TF-IDF веса для всех слов, по word_id)"""
+        doc_idx = self.doc_id_to_idx.get(doc_id)
+        if doc_idx is None:
             return {}
         
-        vector = {}
-        for word in self.forward_index[doc_id]:
-            vector[word] = self.calculate_tf_idf(word, doc_id)
-        
-        return vector
+        self._rebuild_weights_if_dirty()
+        return self.tf_idf_weights[doc_idx]
     
-    def get_query_vector(self, query: str) -> Dict[str, float]:
-        """Получение вектора запроса"""
+    def get_query_vector(self, query: str) -> Dict[int, float]:
+        """Получение вектора запроса (по word_id)"""
         processed_query = self.text_processor.preprocess_text(query)
         if not processed_query:
             return {}
         
-        words = processed_query.split()
-        word_counts = Counter(words)
-        
-        vector = {}
-        for word, count in word_counts.items():
-            # Для запроса используем простую частоту (не нормализованную)
-            tf = count
-            idf = self.calculate_idf(word)
-            vector[word] = tf * idf
+        return self.build_query_vector(processed_query.split())
+    
+    def build_query_vector(self, query_words: List[str]) -> Dict[int, float]:
+        """
+        Построение вектора запроса по уже обработанным словам
+        
+        В режиме cosine веса слов равны tf * idf, в режиме bm25 - числу
+        вхождений слова в запрос (IDF уже учтен во вкладах документов).
+        """
+        word_counts = Counter(query_words)
+        
+        # Словарь и IDF читаются согласованно: новые слова не появляются между ними
+        with self._rebuild_lock:
+            self._refresh_idf_if_dirty()
+            idf = self.idf
+            
+            vector = {}
+            for word, count in word_counts.items():
+                # Слова вне словаря имеют нулевой IDF и в вектор не попадают
+                word_id = self.vocab.get(word)
+                if word_id is None:
+                    continue
+                
+                # Для запроса используем простую частоту (не нормализованную)
+                tf = count
+                vector[word_id] = tf if self.score_mode == 'bm25' else tf * idf[word_id]
         
         return vector
     
-    def calculate_cosine_similarity(self, vec1: Dict[str, float], vec2: Dict[str, float]) -> float:
-        """Вычисление косинусного сходства между векторами"""
-        # Находим общие слова
-        common_words = set(vec1.keys()) & set(vec2.keys())
+    def prepare(self):
+        """
+        Заблаговременный пересчет весов индекса
+        
+        Может вызываться из фонового потока, чтобы первый запрос после загрузки
+        или изменения индекса не ждал пересчета.
+        """
+        self._rebuild_weights_if_dirty()
+    
+    def _rebuild_weights_if_dirty(self):
+        """Ленивый пересчет TF-IDF весов, норм и нормированных весов после изменений индекса"""
+        # Под блокировкой только снимаются входные данные и публикуется результат:
+        # сам пересчет (например, фоновый из prepare) не задерживает изменения индекса.
+        # Если индекс изменился за время пересчета, результат отбрасывается и пересчет
+        # повторяется. Поиск вызывает пересчет, уже удерживая блокировку
+        while self._weights_dirty:
+            with self._rebuild_lock:
+                if not self._weights_dirty:
+                    return
+                version = self._version
+                inputs = self._weight_inputs()
+            
+            weights = self._build_weights(*inputs)
+            
+            with self._rebuild_lock:
+                if self._version == version:
+                    self._publish_weights(*weights)
+    
+    def _weight_inputs(self) -> Tuple:
+        """Снимок данных индекса для пересчета весов (вызывается под блокировкой)"""
+        self._refresh_idf_if_dirty()
+        # Словари частот документов заменяются при изменениях, а не дополняются,
+        # поэтому достаточно поверхностной копии прямого индекса; списки
+        # вхождений в инвертированном индексе меняются на месте и копируются
+        inverted_index = None
+        if self.score_mode == 'bm25':
+            inverted_index = {word_id: dict(postings) for word_id, postings in self.inverted_index.items()}
+        return (self.idf, self.total_documents, dict(self.forward_index),
+                dict(self.document_lengths), inverted_index, list(self.df))
+    
+    def _build_weights(self, idf: List[float], total_documents: int,
+                       forward_index: Dict[int, Dict[int, int]], document_lengths: Dict[int, int],
+                       inverted_index: Optional[Dict[int, Dict[int, int]]], df: List[int]) -> Tuple:
+        """Пересчет TF-IDF весов, норм и нормированных весов по снимку индекса"""
+        tf_idf_weights: Dict[int, Dict[int, float]] = defaultdict(dict)
+        columns: Dict[int, Tuple[List[int], List[float]]] = defaultdict(lambda: ([], []))
+        doc_norms: Dict[int, float] = {}
+        
+        for doc_idx, word_counts in forward_index.items():
+            doc_length = document_lengths[doc_idx]
+            vector = {
+                word_id: count / doc_length * idf[word_id]
+                for word_id, count in word_counts.items()
+            }
+            tf_idf_weights[doc_idx] = vector
+            
+            norm = _vector_norm(vector)
+            doc_norms[doc_idx] = norm
+            if norm == 0 or self.score_mode == 'bm25':
+                continue
+            
+            for word_id, weight in vector.items():
+                if weight > 0:
+                    column_doc_indices, column_weights = columns[word_id]
+                    column_doc_indices.append(doc_idx)
+                    column_weights.append(weight / norm)
+        
+        avgdl, doc_norm_bm25 = self.avgdl, self.doc_norm_bm25
+        if self.score_mode == 'bm25':
+            avgdl, doc_norm_bm25, columns = self._build_bm25_columns(
+                total_documents, document_lengths, inverted_index, df
+            )
+        
+        # Вхождения каждого слова упорядочиваются по убыванию веса, чтобы
+        # приближенный поиск мог ограничиться началом списка
+        normalized_postings: Dict[int, Tuple[array, array]] = {}
+        for word_id, (column_doc_indices, column_weights) in columns.items():
+            order = sorted(range(len(column_weights)), key=column_weights.__getitem__, reverse=True)
+            normalized_postings[word_id] = (
+                array('i', (column_doc_indices[i] for i in order)),
+                array('f', (column_weights[i] for i in order))
+            )
+        
+        term_max_contrib = {
+            word_id: column_weights[0] for word_id, (_, column_weights) in normalized_postings.items()
+        }
+        return tf_idf_weights, normalized_postings, term_max_contrib, doc_norms, avgdl, doc_norm_bm25
+    
+    def _publish_weights(self, tf_idf_weights, normalized_postings, term_max_contrib,
+                         doc_norms, avgdl, doc_norm_bm25):
+        """Подмена весов пересчитанными (вызывается под блокировкой)"""
+        self.tf_idf_weights = tf_idf_weights
+        self.normalized_postings = normalized_postings
+        self.term_max_contrib = term_max_contrib
+        self.doc_norms = doc_norms
+        self.avgdl = avgdl
+        self.doc_norm_bm25 = doc_norm_bm25
+        self._weights_dirty = False
+    
+    def _build_bm25_columns(self, total_documents: int, document_lengths: Dict[int, int],
+                            inverted_index: Dict[int, Dict[int, int]], df: List[int]) -> Tuple:
+        """Вычисление BM25-вкладов слов в документы (не зависят от запроса)"""
+        k1, b = self.k1, self.b
+        
+        avgdl = sum(document_lengths.values()) / total_documents if total_documents else 0.0
+        avgdl_or_one = avgdl or 1.0
+        doc_norm_bm25 = {
+            doc_idx: k1 * (1 - b + b * doc_length / avgdl_or_one)
+            for doc_idx, doc_length in document_lengths.items()
+        }
+        
+        columns: Dict[int, Tuple[List[int], List[float]]] = {}
+        for word_id, postings in inverted_index.items():
+            word_df = df[word_id]
+            idf = math.log(1 + (total_documents - word_df + 0.5) / (word_df + 0.5))
+            columns[word_id] = (
+                list(postings),
+                [idf * tf * (k1 + 1) / (tf + doc_norm_bm25[doc_idx]) for doc_idx, tf in postings.items()]
+            )
+        
+        return avgdl, doc_norm_bm25, columns
+    
+    def get_document_norm(self, doc_id: str) -> float:
+        """Получение нормы TF-IDF вектора документа"""
+        doc_idx = self.doc_id_to_idx.get(doc_id)
+        if doc_idx is None:
+            return 0.0
         
-        if not common_words:
+        self._rebuild_weights_if_dirty()
+        return self.doc_norms.get(doc_idx, 0.0)
+    
+    def calculate_cosine_similarity(self, query_vector: Dict[int, float], doc_id: str) -> float:
+        """Вычисление косинусного сходства между вектором запроса и документом"""
+        doc_vector = self.get_document_vector(doc_id)
+        if not doc_vector:
             return 0.0
         
-        # Вычисляем скалярное произведение
-        dot_product = sum(vec1[word] * vec2[word] for word in common_words)
+        # Скалярное произведение по общим словам
+        dot_product = _sparse_dot(query_vector, doc_vector)
+        if dot_product == 0:
+            return 0.0
         
-        # Вычисляем нормы векторов
-        norm1 = math.sqrt(sum(vec1[word] ** 2 for word in vec1))
-        norm2 = math.sqrt(sum(vec2[word] ** 2 for word in vec2))
+        # Норма документа берется из кэша
+        query_norm = _vector_norm(query_vector)
+        doc_norm = self.doc_norms[self.doc_id_to_idx[doc_id]]
         
-        if norm1 == 0 or norm2 == 0:
+        if query_norm == 0 or doc_norm == 0:
             return 0.0
         
-        return dot_product / (norm1 * norm2)
+        return dot_product / (query_norm * doc_norm)
     
     def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
         """Поиск документов по запросу"""
-        if not query or self.total_documents == 0:
+        if not query or self.total_documents == 0 or top_k <= 0:
             return []
         
         # Получаем вектор запроса
         query_vector = self.get_query_vector(query)
         
-        if not query_vector:
+        return self.search_with_vector(query_vector, top_k)
+    
+    def search_with_vector(self, query_vector: Dict[int, float], top_k: int = 10) -> List[Tuple[str, float]]:
+        """Поиск документов по заранее построенному вектору запроса"""
+        if not query_vector or self.total_documents == 0 or top_k <= 0:
+            return []
+        
+        query_norm = self._query_norm(query_vector)
+        if query_norm == 0:
             return []
         
-        # Вычисляем сходство с каждым документом
-        similarities = []
-        for doc_id in self.forward_index:
-            doc_vector = self.get_document_vector(doc_id)
-            similarity = self.calculate_cosine_similarity(query_vector, doc_vector)
+        # Поиск идет под блокировкой изменений: вхождения, номера строк и doc_ids
+        # не меняются по ходу запроса (освобожденный doc_idx может быть занят заново)
+        with self._rebuild_lock:
+            self._rebuild_weights_if_dirty()
+            
+            # Слова запроса упорядочиваются по убыванию верхней границы вклада
+            terms = []
+            for word_id, query_weight in query_vector.items():
+                column = self.normalized_postings.get(word_id)
+                if column:
+                    terms.append((query_weight * self.term_max_contrib[word_id], query_weight, column))
+            terms.sort(key=itemgetter(0), reverse=True)
+            
+            # remaining_bounds[i] - максимально возможный вклад слов terms[i:]
+            remaining_bounds = [0.0] * (len(terms) + 1)
+            for i in range(len(terms) - 1, -1, -1):
+                remaining_bounds[i] = remaining_bounds[i + 1] + terms[i][0]
+            
+            # Умножение матрицы нормированных весов на вектор запроса по столбцам слов
+            # запроса с отсечением MaxScore: как только оставшиеся слова не могут поднять
+            # новый документ выше текущего K-го результата, новые документы не добавляются.
+            # Оценки копятся в плотном массиве по doc_idx, touched - затронутые документы
+            # (массив общий для запросов: его защищает та же блокировка)
+            scores = self._scores
+            touched: List[int] = []
+            try:
+                pruning = False
+                for i, (_, query_weight, column) in enumerate(terms):
+                    if not pruning and len(touched) >= top_k:
+                        threshold = heapq.nlargest(top_k, map(scores.__getitem__, touched))[-1]
+                        pruning = remaining_bounds[i] < threshold
+                    
+                    if not touched:
+                        # Первое слово: все документы новые, номера добавляются
+                        # в touched одним вызовом без проверок в цикле
+                        doc_indices, weights = self._limit_postings(column)
+                        touched.extend(doc_indices)
+                        for doc_idx, weight in zip(doc_indices, weights):
+                            scores[doc_idx] = query_weight * weight
+                        continue
+                    
+                    postings = self._iter_postings(column)
+                    if not pruning:
+                        for doc_idx, weight in postings:
+                            if not scores[doc_idx]:
+                                touched.append(doc_idx)
+                            scores[doc_idx] += query_weight * weight
+                    else:
+                        for doc_idx, weight in postings:
+                            if scores[doc_idx]:
+                                scores[doc_idx] += query_weight * weight
+                
+                return self._select_top_k(
+                    ((doc_idx, scores[doc_idx]) for doc_idx in touched), top_k, query_norm
+                )
+            finally:
+                for doc_idx in touched:
+                    scores[doc_idx] = 0.0
+    
+    def search_batch(self, query_vectors: List[Dict[int, float]],
+                     top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """
+        Пакетный поиск по нескольким векторам запросов
+        
+        Список вхождений каждого слова проходится один раз для всех запросов,
+        в которых это слово встречается.
+        """
+        if self.total_documents == 0 or top_k <= 0:
+            return [[] for _ in query_vectors]
+        
+        with self._rebuild_lock:
+            self._rebuild_weights_if_dirty()
+            
+            # word_id -> [(номер запроса, вес слова в запросе)]
+            term_queries: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
+            for query_index, query_vector in enumerate(query_vectors):
+                for word_id, query_weight in query_vector.items():
+                    if word_id in self.normalized_postings:
+                        term_queries[word_id].append((query_index, query_weight))
+            
+            batch_scores: List[Dict[int, float]] = [defaultdict(float) for _ in query_vectors]
+            for word_id, weighted_queries in term_queries.items():
+                for doc_idx, weight in self._iter_postings(self.normalized_postings[word_id]):
+                    for query_index, query_weight in weighted_queries:
+                        batch_scores[query_index][doc_idx] += query_weight * weight
             
-            if similarity > 0:
-                similarities.append((doc_id, similarity))
+            results = []
+            for scores, query_vector in zip(batch_scores, query_vectors):
+                query_norm = self._query_norm(query_vector)
+                results.append(self._select_top_k(scores.items(), top_k, query_norm) if query_norm else [])
+            
+            return results
+    
+    def _query_norm(self, query_vector: Dict[int, float]) -> float:
+        """Нормирующий множитель запроса (в режиме bm25 нормировка не нужна)"""
+        if self.score_mode == 'bm25':
+            return 1.0
+        return _vector_norm(query_vector)
+    
+    def _limit_postings(self, column: Tuple[array, array]) -> Tuple[array, array]:
+        """Вхождения слова, просматриваемые при поиске (doc_idx, нормированные веса)"""
+        doc_indices, weights = column
         
-        # Сортируем по убыванию сходства
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # На больших корпусах просматриваются только вхождения с наибольшими весами
+        if self.total_documents >= self.approximate_threshold:
+            limit = self.max_postings_per_term
+            return doc_indices[:limit], weights[:limit]
         
-        return similarities[:top_k]
+        return doc_indices, weights
+    
+    def _iter_postings(self, column: Tuple[array, array]):
+        """Итерация по вхождениям слова (doc_idx, нормированный вес)"""
+        return zip(*self._limit_postings(column))
+    
+    def _select_top_k(self, scores: Iterable[Tuple[int, float]], top_k: int,
+                      query_norm: float) -> List[Tuple[str, float]]:
+        """Отбор лучших результатов ограниченной min-кучей размера top_k"""
+        heap: List[Tuple[float, int]] = []
+        for doc_idx, dot_product in scores:
+            if dot_product <= 0:
+                continue
+            
+            if len(heap) < top_k:
+                heapq.heappush(heap, (dot_product, doc_idx))
+            elif dot_product > heap[0][0]:
+                heapq.heappushpop(heap, (dot_product, doc_idx))
+        
+        # Номера строк переводятся обратно в doc_id только для результатов
+        heap.sort(reverse=True)
+        doc_ids = self.doc_ids
+        return [(doc_ids[doc_idx], dot_product / query_norm) for dot_product, doc_idx in heap]
     
     def get_document_keywords(self, doc_id: str, top_k: int = 10) -> List[Tuple[str, float]]:
         """Получение ключевых слов документа с их TF-IDF весами"""
-        if doc_id not in self.forward_index:
+        if doc_id not in self.doc_id_to_idx:
             return []
         
         vector = self.get_document_vector(doc_id)
-        keywords = [(word, weight) for word, weight in vector.items()]
-        keywords.sort(key=lambda x: x[1], reverse=True)
-        
-        return keywords[:top_k]
+        inv_vocab = self.inv_vocab
+        return [
+            (inv_vocab[word_id], weight)
+            for word_id, weight in heapq.nlargest(top_k, vector.items(), key=itemgetter(1))
+        ]
     
     def get_stats(self) -> Dict[str, any]:
         """Получение статистики индекса"""
-        total_words = sum(len(doc_words) for doc_words in self.forward_index.values())
-        unique_words = len(self.inverted_index)
+        # Статистика может запрашиваться из фонового потока, поэтому прямой индекс
+        # обходится под той же блокировкой, что и изменения документов
+        with self._rebuild_lock:
+            total_words = sum(len(doc_words) for doc_words in self.forward_index.values())
+            unique_words = len(self.inverted_index)
         
         return {
             'total_documents': self.total_documents,
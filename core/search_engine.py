@@ -2,48 +2,83 @@
 Основной поисковый движок для семантического поиска
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Pattern, Sequence, Tuple
 from utils.document_manager import DocumentManager, Document
 from core.document_indexer import DocumentIndex
 from core.text_processor import TextProcessor
 
 
+# Минимальное число документов, начиная с которого переиндексация идет в нескольких процессах
+# (запуск процессов через spawn заметен, на меньших объемах он не окупается)
+PARALLEL_REINDEX_THRESHOLD = 1000
+
+# Обработчик текста в процессе-исполнителе (создается один раз на процесс)
+_worker_text_processor: Optional[TextProcessor] = None
+
+
+def _init_reindex_worker():
+    """Инициализация процесса-исполнителя переиндексации"""
+    global _worker_text_processor
+    _worker_text_processor = TextProcessor()
+
+
+def _preprocess_in_worker(content: str) -> str:
+    """Обработка текста документа в процессе-исполнителе"""
+    return _worker_text_processor.preprocess_text(content)
+
+
+@lru_cache(maxsize=256)
+def _keyword_pattern(keywords: Tuple[str, ...]) -> Pattern:
+    """Регулярное выражение для поиска любого из ключевых слов без учета регистра"""
+    return re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE)
+
+
+def _make_snippet(content: str, keywords: Sequence[str], max_length: int = 200) -> str:
+    """Фрагмент текста документа вокруг первого вхождения ключевых слов"""
+    if len(content) <= max_length:
+        return content
+    
+    # Находим первое вхождение любого из ключевых слов одним проходом по тексту,
+    # без создания копии документа в нижнем регистре
+    if keywords:
+        match = _keyword_pattern(tuple(keywords)).search(content)
+        if match:
+            pos = match.start()
+            # Берем текст вокруг найденного ключевого слова
+            start = max(0, pos - max_length // 2)
+            end = min(len(content), start + max_length)
+            
+            snippet = content[start:end]
+            if start > 0:
+                snippet = "..." + snippet
+            if end < len(content):
+                snippet = snippet + "..."
+            
+            return snippet
+    
+    # Если ключевые слова не найдены, берем начало документа
+    return content[:max_length] + "..."
+
+
 class SearchResult:
     """Класс для представления результата поиска"""
     
-    def __init__(self, document: Document, score: float, matched_keywords: List[str]):
+    def __init__(self, document: Document, score: float, matched_keywords: List[str],
+                 snippet: Optional[str] = None):
         self.document = document
         self.score = score
         self.matched_keywords = matched_keywords
-        self.snippet = self._generate_snippet()
+        # Фрагмент строится сразу (в потоке, выполняющем поиск), если не передан готовый
+        self.snippet = snippet if snippet is not None else self._generate_snippet()
     
     def _generate_snippet(self, max_length: int = 200) -> str:
         """Генерация краткого описания документа"""
-        content = self.document.content
-        
-        if len(content) <= max_length:
-            return content
-        
-        # Находим первое вхождение ключевого слова
-        content_lower = content.lower()
-        for keyword in self.matched_keywords:
-            keyword_lower = keyword.lower()
-            pos = content_lower.find(keyword_lower)
-            if pos != -1:
-                # Берем текст вокруг найденного ключевого слова
-                start = max(0, pos - max_length // 2)
-                end = min(len(content), start + max_length)
-                
-                snippet = content[start:end]
-                if start > 0:
-                    snippet = "..." + snippet
-                if end < len(content):
-                    snippet = snippet + "..."
-                
-                return snippet
-        
-        # Если ключевые слова не найдены, берем начало документа
-        return content[:max_length] + "..."
+        return _make_snippet(self.document.content, self.matched_keywords, max_length)
     
     def to_dict(self) -> Dict[str, Any]:
         """Преобразование результата в словарь"""
@@ -61,10 +96,28 @@ class SearchResult:
 class SearchEngine:
     """Основной поисковый движок"""
     
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", score_mode: str = "cosine",
+                 text_processor: Optional[TextProcessor] = None):
         self.document_manager = DocumentManager(data_dir)
-        self.index = DocumentIndex()
-        self.text_processor = TextProcessor()
+        self.score_mode = score_mode
+        self.index = DocumentIndex(score_mode=score_mode)
+        # Обработчик текста может передаваться извне, чтобы один экземпляр
+        # использовался всеми компонентами приложения
+        self.text_processor = text_processor if text_processor is not None else TextProcessor()
+        
+        # Кэш обработанных запросов: (query, версия индекса) -> (ключевые слова, вектор
+        # запроса). Вектор зависит от словаря и IDF, поэтому версия увеличивается после
+        # каждого изменения индекса: вектор, построенный во время изменения, сохраняется
+        # под прежней версией и после изменения не находится
+        self._index_version = 0
+        self._prepare_query = lru_cache(maxsize=1024)(self._build_query)
+        
+        # Кэш фрагментов результатов: (doc_id, ключевые слова) -> фрагмент
+        self._snippet_cache = lru_cache(maxsize=1024)(self._build_snippet)
+        
+        # Кэш статистики (пересчитывается после изменения документов или индекса)
+        self._stats_cache: Optional[Dict[str, Any]] = None
+        self._stats_dirty = True
         
         # Переиндексация существующих документов
         self._reindex_documents()
@@ -72,14 +125,47 @@ class SearchEngine:
     def _reindex_documents(self):
         """Переиндексация всех документов"""
         documents = self.document_manager.get_all_documents()
-        for doc in documents:
-            self.index.add_document(doc.doc_id, doc.content)
-            # Обновляем обработанное содержимое в документе
-            processed_content = self.text_processor.preprocess_text(doc.content)
-            self.document_manager.update_document_content(doc.doc_id, processed_content)
+        contents = [doc.content for doc in documents]
+        
+        # Обработка текстов независима по документам: на больших корпусах она идет
+        # в нескольких процессах, а слияние в индекс выполняется последовательно
+        if len(documents) >= PARALLEL_REINDEX_THRESHOLD:
+            processed_contents = self._preprocess_parallel(contents)
+        else:
+            processed_contents = [self.text_processor.preprocess_text(content) for content in contents]
+        
+        # Текст обрабатывается один раз: слова идут и в индекс, и в документ.
+        # Изменения документов группируются: журнал сбрасывается один раз
+        batch = []
+        with self.document_manager.batch():
+            for doc, processed_content in zip(documents, processed_contents):
+                tokens = processed_content.split()
+                batch.append((doc.doc_id, doc.content, tokens))
+                self.document_manager.update_document_content(doc.doc_id, processed_content, tokens)
+        
+        self.index.add_documents(batch)
         
         print(f"Переиндексировано {len(documents)} документов")
     
+    def warm_up(self):
+        """Подготовка индекса к первому запросу (пересчет весов заранее)"""
+        self.index.prepare()
+    
+    def _preprocess_parallel(self, contents: List[str]) -> List[str]:
+        """Обработка текстов документов в пуле процессов"""
+        workers = os.cpu_count() or 1
+        chunksize = max(1, len(contents) // (workers * 4))
+        # Процессы запускаются через spawn: fork из процесса с потоками (GUI, пул
+        # статистики) может унаследовать захваченные блокировки и зависнуть
+        context = multiprocessing.get_context('spawn')
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_reindex_worker) as executor:
+                return list(executor.map(_preprocess_in_worker, contents, chunksize=chunksize))
+        except Exception as e:
+            print(f"Параллельная обработка недоступна, обрабатываем последовательно: {e}")
+            return [self.text_processor.preprocess_text(content) for content in contents]
+    
     def add_document(self, title: str, content: str, 
                     file_path: Optional[str] = None, 
                     metadata: Optional[Dict] = None) -> str:
@@ -87,12 +173,18 @@ class SearchEngine:
         # Добавляем документ в менеджер
         doc_id = self.document_manager.add_document(title, content, file_path, metadata)
         
+        # Обрабатываем текст один раз для индекса и документа
+        processed_content = self.text_processor.preprocess_text(content)
+        tokens = processed_content.split()
+        
         # Добавляем в индекс
-        self.index.add_document(doc_id, content)
+        self.index.add_document(doc_id, content, tokens)
+        self._index_changed()
+        self._snippet_cache.cache_clear()
+        self._stats_dirty = True
         
         # Обновляем обработанное содержимое
-        processed_content = self.text_processor.preprocess_text(content)
-        self.document_manager.update_document_content(doc_id, processed_content)
+        self.document_manager.update_document_content(doc_id, processed_content, tokens)
         
         return doc_id
     
@@ -101,6 +193,9 @@ class SearchEngine:
         success = self.document_manager.delete_document(doc_id)
         if success:
             self.index.remove_document(doc_id)
+            self._index_changed()
+            self._snippet_cache.cache_clear()
+            self._stats_dirty = True
         return success
     
     def search(self, query: str, top_k: int = 10, 
@@ -116,15 +211,79 @@ class SearchEngine:
         Returns:
             Список результатов поиска
         """
+        return list(self.iter_search(query, top_k, min_score))
+    
+    def iter_search(self, query: str, top_k: int = 10,
+                    min_score: float = 0.01) -> Iterator[SearchResult]:
+        """
+        Поиск документов по запросу с выдачей результатов по одному
+        
+        Результаты выдаются в порядке убывания релевантности по мере формирования,
+        поэтому первый из них доступен до подготовки остальных.
+        """
         if not query.strip():
-            return []
+            return
+        
+        # Слова и вектор запроса берутся из кэша: повторный запрос (в том числе
+        # с другим top_k) не обрабатывается заново
+        query_keywords, query_vector = self._prepare_query(query, self._index_version)
+        if not query_keywords:
+            return
         
         # Выполняем поиск в индексе
-        search_results = self.index.search(query, top_k * 2)  # Берем больше для фильтрации
+        search_results = self.index.search_with_vector(query_vector, top_k * 2)  # Берем больше для фильтрации
         
-        results = []
+        yield from self._iter_results(search_results, query_keywords, top_k, min_score)
+    
+    def embed(self, query: str) -> Dict[str, float]:
+        """Вектор запроса с ключами-словами (для сравнения запросов между собой)"""
+        _, query_vector = self._prepare_query(query, self._index_version)
+        inv_vocab = self.index.inv_vocab
+        return {inv_vocab[word_id]: weight for word_id, weight in query_vector.items()}
+    
+    def _build_query(self, query: str, index_version: int) -> Tuple[Tuple[str, ...], Dict[int, float]]:
+        """Обработка запроса: ключевые слова и вектор запроса (index_version - часть ключа кэша)"""
+        # Обрабатываем запрос один раз: слова нужны и для вектора, и для ключевых слов
         processed_query = self.text_processor.preprocess_text(query)
-        query_keywords = processed_query.split() if processed_query else []
+        if not processed_query:
+            return (), {}
+        
+        query_keywords = tuple(processed_query.split())
+        return query_keywords, self.index.build_query_vector(query_keywords)
+    
+    def search_batch(self, queries: List[str], top_k: int = 10,
+                     min_score: float = 0.01) -> List[List[SearchResult]]:
+        """
+        Пакетный поиск по нескольким запросам
+        
+        Args:
+            queries: Список поисковых запросов
+            top_k: Количество результатов для каждого запроса
+            min_score: Минимальный балл релевантности
+        
+        Returns:
+            Список результатов поиска для каждого запроса (в порядке запросов)
+        """
+        batch_keywords = []
+        for query in queries:
+            processed_query = self.text_processor.preprocess_text(query)
+            batch_keywords.append(processed_query.split() if processed_query else [])
+        
+        # Все запросы оцениваются за один проход по спискам вхождений
+        query_vectors = [self.index.build_query_vector(keywords) for keywords in batch_keywords]
+        batch_results = self.index.search_batch(query_vectors, top_k * 2)
+        
+        return [
+            list(self._iter_results(search_results, query_keywords, top_k, min_score))
+            for search_results, query_keywords in zip(batch_results, batch_keywords)
+        ]
+    
+    def _iter_results(self, search_results: List[Tuple[str, float]], query_keywords: Sequence[str],
+                      top_k: int, min_score: float) -> Iterator[SearchResult]:
+        """Формирование результатов поиска из найденных документов"""
+        count = 0
+        # Документы берутся прямо из словаря менеджера, без вызова метода на каждый doc_id
+        get_document = self.document_manager.documents.get
         
         for doc_id, score in search_results:
             # Фильтруем по минимальному баллу
@@ -132,34 +291,35 @@ class SearchEngine:
                 continue
             
             # Получаем документ
-            document = self.document_manager.get_document(doc_id)
+            document = get_document(doc_id)
             if not document:
                 continue
             
             # Определяем совпавшие ключевые слова
-            matched_keywords = self._find_matched_keywords(
-                document.processed_content, query_keywords
-            )
+            matched_keywords = self._find_matched_keywords(document, query_keywords)
             
             # Создаем результат поиска
-            result = SearchResult(document, score, matched_keywords)
-            results.append(result)
+            yield self.make_result(document, score, matched_keywords)
             
-            if len(results) >= top_k:
+            count += 1
+            if count >= top_k:
                 break
-        
-        return results
     
-    def _find_matched_keywords(self, doc_content: str, query_keywords: List[str]) -> List[str]:
+    def make_result(self, document: Document, score: float,
+                    matched_keywords: List[str]) -> SearchResult:
+        """Создание результата поиска с фрагментом из кэша фрагментов"""
+        snippet = self._snippet_cache(document.doc_id, tuple(matched_keywords))
+        return SearchResult(document, score, matched_keywords, snippet)
+    
+    def _build_snippet(self, doc_id: str, keywords: Tuple[str, ...]) -> str:
+        """Построение фрагмента документа для набора ключевых слов"""
+        document = self.document_manager.get_document(doc_id)
+        return _make_snippet(document.content, keywords) if document else ""
+    
+    def _find_matched_keywords(self, document: Document, query_keywords: Sequence[str]) -> List[str]:
         """Поиск совпавших ключевых слов в документе"""
-        matched = []
-        doc_words = set(doc_content.split())
-        
-        for keyword in query_keywords:
-            if keyword in doc_words:
-                matched.append(keyword)
-        
-        return matched
+        doc_words = document.token_set
+        return [keyword for keyword in query_keywords if keyword in doc_words]
     
     def search_by_title(self, query: str) -> List[Document]:
         """Поиск документов по заголовку"""
@@ -175,27 +335,44 @@ class SearchEngine:
     
     def get_stats(self) -> Dict[str, Any]:
         """Получение статистики поисковой системы"""
+        if not self._stats_dirty:
+            return self._stats_cache
+        
+        # Флаг сбрасывается до подсчета: изменение документов во время подсчета
+        # (статистика считается в фоновом потоке) снова пометит кэш устаревшим
+        self._stats_dirty = False
         doc_stats = self.document_manager.get_stats()
         index_stats = self.index.get_stats()
         
-        return {
+        stats = {
             'documents': doc_stats,
             'index': index_stats,
             'total_documents': doc_stats['total_documents']
         }
+        self._stats_cache = stats
+        return stats
     
     def rebuild_index(self):
         """Перестроение индекса"""
         print("Перестроение индекса...")
         
-        # Очищаем индекс
-        self.index = DocumentIndex()
-        
-        # Переиндексируем все документы
+        # Очищаем индекс и переиндексируем все документы
+        self.index = DocumentIndex(score_mode=self.score_mode)
         self._reindex_documents()
         
+        # Кэши сбрасываются после переиндексации: запросы во время нее
+        # строились по неполному индексу
+        self._index_changed()
+        self._snippet_cache.cache_clear()
+        self._stats_dirty = True
+        
         print("Индекс перестроен")
     
+    def _index_changed(self):
+        """Новая версия индекса: векторы запросов прежних версий больше не используются"""
+        self._index_version += 1
+        self._prepare_query.cache_clear()
+    
     def suggest_keywords(self, query: str, max_suggestions: int = 5) -> List[str]:
         """Предложение ключевых слов на основе запроса"""
         if not query.strip():
@@ -211,7 +388,7 @@ class SearchEngine:
         
         # Ищем похожие слова в индексе
         for word in query_words:
-            if word in self.index.inverted_index:
+            if self.index.has_word(word):
                 # Берем слова, которые часто встречаются вместе с этим словом
                 suggestions.append(word)
         
@@ -2,12 +2,19 @@ import re
 from typing import List, Set
 
 
+# Регулярные выражения компилируются один раз при импорте модуля
+_NON_LETTERS_RE = re.compile(r'[^а-яё\s]')
+_SPACES_RE = re.compile(r'\s+')
+
+
 class TextProcessor:
     """Класс для обработки текста и пользовательских запросов"""
     
     def __init__(self):
         self.stop_words = self._load_russian_stop_words()
         self.word_endings = self._load_word_endings()
+        # Окончания по убыванию длины (от длинных к коротким) для стемминга
+        self._sorted_endings = sorted(self.word_endings, key=len, reverse=True)
     
     def _load_russian_stop_words(self) -> Set[str]:
         """Загрузка русских стоп-слов"""
@@ -54,10 +61,7 @@ class TextProcessor:
         if len(word) < 4:
             return word
         
-        # Сортируем окончания по длине (от длинных к коротким)
-        sorted_endings = sorted(self.word_endings, key=len, reverse=True)
-        
-        for ending in sorted_endings:
+        for ending in self._sorted_endings:
             if word.endswith(ending) and len(word) - len(ending) >= 2:
                 return word[:-len(ending)]
         
@@ -80,10 +84,10 @@ class TextProcessor:
         text = text.lower()
         
         # 2. Удаление лишних символов и цифр, оставляем только буквы и пробелы
-        text = re.sub(r'[^а-яё\s]', ' ', text)
+        text = _NON_LETTERS_RE.sub(' ', text)
         
         # 3. Удаление множественных пробелов
-        text = re.sub(r'\s+', ' ', text)
+        text = _SPACES_RE.sub(' ', text)
         
         # 4. Разбивка на слова
         words = text.split()
@@ -6,50 +6,264 @@
 
 import sys
 import os
+import hashlib
+import logging
+import mmap
+import threading
+from collections import OrderedDict
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QPushButton, 
-                             QTextEdit, QListWidget, QListWidgetItem, QTabWidget,
+                             QTextEdit, QListView, QTabWidget,
                              QGroupBox, QGridLayout, QSpinBox, QDoubleSpinBox,
                              QFileDialog, QMessageBox, QSplitter, QFrame,
                              QProgressBar, QStatusBar, QMenuBar, QAction,
                              QDialog, QDialogButtonBox, QFormLayout, QComboBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
-from PyQt5.QtGui import QFont, QIcon, QPixmap, QPalette, QColor
+from PyQt5.QtCore import (Qt, QObject, QThread, pyqtSignal, pyqtSlot, QTimer,
+                          QAbstractListModel, QModelIndex, QSortFilterProxyModel,
+                          QRunnable, QThreadPool)
+from PyQt5.QtGui import QFont, QIcon, QPixmap, QPalette, QColor, QTextCursor, QTextDocument
 
 # Добавляем путь к корневой директории проекта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.search_engine import SearchEngine, SearchResult
 from core.text_processor import TextProcessor
+from gui.semantic_cache import SemanticCache
+from gui.persistent_cache import PersistentQueryCache
 
 
-class SearchWorker(QThread):
-    """Поток для выполнения поиска в фоновом режиме"""
+logger = logging.getLogger(__name__)
+
+# Таблица стилей приложения (разбирается Qt один раз для всех окон)
+_APP_STYLE = """
+    QMainWindow {
+        background-color: #f0f0f0;
+    }
+    QGroupBox {
+        font-weight: bold;
+        border: 2px solid #cccccc;
+        border-radius: 5px;
+        margin-top: 1ex;
+        padding-top: 10px;
+    }
+    QGroupBox::title {
+        subcontrol-origin: margin;
+        left: 10px;
+        padding: 0 5px 0 5px;
+    }
+    QPushButton {
+        background-color: #4CAF50;
+        border: none;
+        color: white;
+        padding: 8px 16px;
+        text-align: center;
+        font-size: 14px;
+        border-radius: 4px;
+    }
+    QPushButton:hover {
+        background-color: #45a049;
+    }
+    QPushButton:pressed {
+        background-color: #3d8b40;
+    }
+    QLineEdit, QTextEdit {
+        border: 1px solid #ddd;
+        border-radius: 4px;
+        padding: 5px;
+    }
+    QLineEdit:focus, QTextEdit:focus {
+        border: 2px solid #4CAF50;
+    }
+    QListView {
+        border: 1px solid #ddd;
+        border-radius: 4px;
+        background-color: white;
+    }
+    QListView::item {
+        padding: 5px;
+        border-bottom: 1px solid #eee;
+    }
+    QListView::item:selected {
+        background-color: #4CAF50;
+        color: white;
+    }
+    QListView::item:hover {
+        background-color: #f0f8ff;
+    }
+"""
+
+# Файл хранимого кэша запросов (в директории данных)
+QUERY_CACHE_FILE = "query_cache.sqlite3"
+
+
+def _documents_fingerprint(search_engine):
+    """Отпечаток набора документов, для которого действителен кэш запросов"""
+    doc_ids = sorted(search_engine.document_manager.documents)
+    return hashlib.sha1('\n'.join([search_engine.score_mode] + doc_ids).encode('utf-8')).hexdigest()
+
+
+class SearchWorker(QObject):
+    """Исполнитель поиска, работающий в отдельном долгоживущем потоке"""
+    
+    # Результаты передаются по одному по мере готовности, затем - сигнал завершения
+    # с их количеством. Сигналы передают номер поколения поиска, чтобы окно
+    # отбрасывало устаревшие ответы
+    result_ready = pyqtSignal(int, object)
+    search_finished = pyqtSignal(int, int)
+    search_error = pyqtSignal(int, str)
+    
+    def __init__(self, search_engine, semantic_cache=None, query_store=None):
+        super().__init__()
+        self.search_engine = search_engine
+        self.semantic_cache = semantic_cache
+        self.query_store = query_store
+        # Номер последнего запрошенного поиска (устанавливается из потока окна);
+        # поиски более старых поколений пропускаются или прерываются
+        self.latest_generation = 0
+    
+    @pyqtSlot(int, str, int, float)
+    def do_search(self, generation, query, top_k, min_score):
+        if generation != self.latest_generation:
+            return
+        
+        try:
+            if self.semantic_cache is not None:
+                results = self._iter_with_semantic_cache(query, top_k, min_score)
+            else:
+                results = self.search_engine.iter_search(query, top_k, min_score)
+            
+            count = 0
+            for result in results:
+                if generation != self.latest_generation:
+                    return
+                self.result_ready.emit(generation, result)
+                count += 1
+            
+            self.search_finished.emit(generation, count)
+        except Exception as e:
+            self.search_error.emit(generation, str(e))
+    
+    def _iter_with_semantic_cache(self, query, top_k, min_score):
+        """Поиск с возвратом результатов близкого ранее выполненного запроса"""
+        # Эпоха хранимого кэша и поколение семантического кэша запоминаются до поиска:
+        # результаты поиска, во время которого изменились документы, в кэши не попадают
+        epoch = self.query_store.epoch if self.query_store is not None else None
+        generation = self.semantic_cache.generation
+        vector = self.search_engine.embed(query)
+        params = (top_k, min_score)
+        
+        # Сначала проверяется хранимый кэш: точное совпадение запроса текущей эпохи
+        if self.query_store is not None:
+            stored = self.query_store.get(query, params)
+            if stored is not None:
+                yield from self._results_from_entries(stored[1])
+                return
+        
+        # В кэше хранятся (doc_id, релевантность, ключевые слова), а не документы
+        cached = self.semantic_cache.lookup(vector, params)
+        if cached is not None:
+            yield from self._results_from_entries(cached)
+            return
+        
+        # Результаты выдаются по мере формирования; в кэш попадает только полный список
+        entries = []
+        for result in self.search_engine.iter_search(query, top_k, min_score):
+            entries.append((result.document.doc_id, result.score, result.matched_keywords))
+            yield result
+        self.semantic_cache.add(vector, params, entries, generation)
+        if self.query_store is not None:
+            self.query_store.put(query, params, vector, entries, epoch)
+    
+    def _results_from_entries(self, entries):
+        """Восстановление результатов поиска из записей кэша"""
+        for doc_id, score, matched_keywords in entries:
+            document = self.search_engine.get_document(doc_id)
+            if document:
+                yield self.search_engine.make_result(document, score, list(matched_keywords))
+
+
+class FileReadWorker(QThread):
+    """Поток для чтения файла документа в фоновом режиме"""
     
-    search_completed = pyqtSignal(list)
-    search_error = pyqtSignal(str)
+    read_done = pyqtSignal(str, str)
+    read_error = pyqtSignal(str, str)
     
-    def __init__(self, search_engine, query, top_k, min_score):
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+    
+    def run(self):
+        try:
+            # Файл отображается в память и декодируется за один проход,
+            # без промежуточного буфера чтения
+            with open(self.file_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    content = ""
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        content = str(mm, 'utf-8')
+            self.read_done.emit(self.file_path, content)
+        except Exception as e:
+            self.read_error.emit(self.file_path, str(e))
+
+
+class StatsSignals(QObject):
+    """Сигналы StatsWorker (QRunnable не является QObject и не может их объявлять)"""
+    
+    # (номер запроса статистики, статистика)
+    done = pyqtSignal(int, dict)
+    failed = pyqtSignal(int, str)
+
+
+class StatsWorker(QRunnable):
+    """Задача пула потоков для подсчета статистики поисковой системы"""
+    
+    def __init__(self, search_engine, generation):
         super().__init__()
         self.search_engine = search_engine
-        self.query = query
-        self.top_k = top_k
-        self.min_score = min_score
+        self.generation = generation
+        self.signals = StatsSignals()
     
     def run(self):
         try:
-            results = self.search_engine.search(self.query, self.top_k, self.min_score)
-            self.search_completed.emit(results)
+            self.signals.done.emit(self.generation, self.search_engine.get_stats())
         except Exception as e:
-            self.search_error.emit(str(e))
+            self.signals.failed.emit(self.generation, str(e))
+
+
+class EngineLoader(QThread):
+    """Поток для создания поисковой системы (загрузка документов и индексация)"""
+    
+    ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, text_processor=None):
+        super().__init__()
+        self.text_processor = text_processor
+    
+    def run(self):
+        try:
+            engine = SearchEngine(text_processor=self.text_processor)
+            # Веса индекса пересчитываются здесь же, чтобы первый запрос не ждал пересчета
+            engine.warm_up()
+            self.ready.emit(engine)
+        except Exception as e:
+            self.failed.emit(str(e))
 
 
 class DocumentDialog(QDialog):
     """Диалог для добавления/редактирования документа"""
     
+    # Тексты больше этого размера вставляются в редактор частями по INSERT_CHUNK_SIZE
+    # символов, чтобы редактор успевал отрисовываться между частями
+    CHUNKED_INSERT_THRESHOLD = 16 * 1024 * 1024
+    INSERT_CHUNK_SIZE = 1024 * 1024
+    
     def __init__(self, parent=None, document=None):
         super().__init__(parent)
         self.document = document
+        # Потоки чтения файлов хранятся до завершения
+        self.file_read_workers = []
         self.setup_ui()
         
         if document:
@@ -96,6 +310,7 @@ class DocumentDialog(QDialog):
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
         layout.addRow(buttons)
+        self.ok_button = buttons.button(QDialogButtonBox.Ok)
         
         self.setLayout(layout)
     
@@ -106,17 +321,59 @@ class DocumentDialog(QDialog):
         )
         if file_path:
             self.file_edit.setText(file_path)
-            # Автоматически загружаем содержимое файла
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    self.content_edit.setPlainText(content)
-                    # Устанавливаем заголовок из имени файла
-                    if not self.title_edit.text():
-                        filename = os.path.basename(file_path)
-                        self.title_edit.setText(filename)
-            except Exception as e:
-                QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать файл: {e}")
+            # Автоматически загружаем содержимое файла в фоновом потоке;
+            # до окончания чтения подтверждение диалога недоступно
+            self.ok_button.setEnabled(False)
+            worker = FileReadWorker(file_path)
+            worker.read_done.connect(self.on_file_read)
+            worker.read_error.connect(self.on_file_read_error)
+            worker.finished.connect(lambda: self.file_read_workers.remove(worker))
+            self.file_read_workers.append(worker)
+            worker.start()
+    
+    def on_file_read(self, file_path, content):
+        """Обработка завершения чтения файла"""
+        # Результаты чтения ранее выбранного файла не нужны
+        if file_path != self.file_edit.text():
+            return
+        
+        if len(content) > self.CHUNKED_INSERT_THRESHOLD:
+            # Подтверждение станет доступно после вставки последней части
+            self.content_edit.clear()
+            self._insert_chunk(file_path, content, 0)
+        else:
+            self.ok_button.setEnabled(True)
+            self.content_edit.setPlainText(content)
+        
+        # Устанавливаем заголовок из имени файла
+        if not self.title_edit.text():
+            filename = os.path.basename(file_path)
+            self.title_edit.setText(filename)
+    
+    def _insert_chunk(self, file_path, content, start):
+        """Вставка очередной части большого текста в редактор"""
+        # Выбран другой файл - вставка прекращается
+        if file_path != self.file_edit.text():
+            return
+        
+        end = start + self.INSERT_CHUNK_SIZE
+        cursor = self.content_edit.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(content[start:end])
+        
+        if end < len(content):
+            QTimer.singleShot(0, lambda: self._insert_chunk(file_path, content, end))
+        else:
+            self.content_edit.moveCursor(QTextCursor.Start)
+            self.ok_button.setEnabled(True)
+    
+    def on_file_read_error(self, file_path, error_message):
+        """Обработка ошибки чтения файла"""
+        if file_path != self.file_edit.text():
+            return
+        
+        self.ok_button.setEnabled(True)
+        QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать файл: {error_message}")
     
     def load_document(self):
         if self.document:
@@ -133,6 +390,187 @@ class DocumentDialog(QDialog):
         }
 
 
+class DocumentListModel(QAbstractListModel):
+    """Модель списка документов с постраничной подгрузкой строк"""
+    
+    # Количество строк, подгружаемых за один раз
+    PAGE_SIZE = 200
+    # Количество запоминаемых текстов строк
+    CACHE_SIZE = 1000
+    
+    def __init__(self, search_engine, parent=None):
+        super().__init__(parent)
+        self.search_engine = search_engine
+        # Модель хранит только идентификаторы; документы запрашиваются для видимых строк
+        self._doc_ids = []
+        self._loaded = 0
+        self._text_cache = OrderedDict()
+        self.reload()
+    
+    def reload(self):
+        """Полная перезагрузка списка документов"""
+        self.beginResetModel()
+        # До загрузки поисковой системы список пуст
+        if self.search_engine is None:
+            self._doc_ids = []
+        else:
+            self._doc_ids = list(self.search_engine.document_manager.documents)
+        self._loaded = min(self.PAGE_SIZE, len(self._doc_ids))
+        self._text_cache.clear()
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+    
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._loaded < len(self._doc_ids)
+    
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        
+        count = min(self.PAGE_SIZE, len(self._doc_ids) - self._loaded)
+        if count <= 0:
+            return
+        
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._loaded:
+            return None
+        
+        doc_id = self._doc_ids[index.row()]
+        if role == Qt.UserRole:
+            return doc_id
+        if role == Qt.DisplayRole:
+            return self._display_text(doc_id)
+        return None
+    
+    def _display_text(self, doc_id):
+        """Текст строки документа (запоминаются последние CACHE_SIZE строк)"""
+        text = self._text_cache.get(doc_id)
+        if text is not None:
+            self._text_cache.move_to_end(doc_id)
+            return text
+        
+        doc = self.search_engine.get_document(doc_id)
+        if not doc:
+            return doc_id
+        
+        text = f"{doc.title}\nID: {doc.doc_id}\nСимволов: {doc.content_len}"
+        self._text_cache[doc_id] = text
+        if len(self._text_cache) > self.CACHE_SIZE:
+            self._text_cache.popitem(last=False)
+        return text
+    
+    def add_document(self, doc_id):
+        """Добавление строки нового документа"""
+        if doc_id in self._doc_ids:
+            return
+        
+        # Если подгружены не все строки, новая строка появится при подгрузке
+        if self._loaded < len(self._doc_ids):
+            self._doc_ids.append(doc_id)
+            return
+        
+        row = len(self._doc_ids)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._doc_ids.append(doc_id)
+        self._loaded += 1
+        self.endInsertRows()
+    
+    def remove_document(self, doc_id):
+        """Удаление строки документа"""
+        try:
+            row = self._doc_ids.index(doc_id)
+        except ValueError:
+            return
+        
+        self._text_cache.pop(doc_id, None)
+        if row >= self._loaded:
+            del self._doc_ids[row]
+            return
+        
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._doc_ids[row]
+        self._loaded -= 1
+        self.endRemoveRows()
+
+
+class SearchResultsModel(QAbstractListModel):
+    """Модель списка результатов поиска"""
+    
+    # Шаблон текста элемента списка результатов
+    RESULT_TEXT = "{}. {}\n   Релевантность: {:.4f}\n   Ключевые слова: {}"
+    EMPTY_TEXT = "Результаты не найдены"
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._results = []
+        # Тексты строк; при пустом результате - одна строка EMPTY_TEXT без результата
+        self._texts = []
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._texts)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self._texts[row]
+        if role == Qt.UserRole:
+            return self._results[row] if row < len(self._results) else None
+        return None
+    
+    def results(self):
+        return list(self._results)
+    
+    def set_results(self, results):
+        """Замена всех результатов (тексты строк готовятся одним проходом)"""
+        self.beginResetModel()
+        self._results = list(results)
+        self._texts = [self._format(i, result) for i, result in enumerate(self._results, 1)]
+        if not self._texts:
+            self._texts.append(self.EMPTY_TEXT)
+        self.endResetModel()
+    
+    def clear(self):
+        """Очистка результатов"""
+        self.beginResetModel()
+        self._results = []
+        self._texts = []
+        self.endResetModel()
+    
+    def append_result(self, result):
+        """Добавление очередного результата в конец списка"""
+        row = len(self._results)
+        if len(self._texts) > row:
+            # Убираем строку EMPTY_TEXT
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._texts[row:]
+            self.endRemoveRows()
+        
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._results.append(result)
+        self._texts.append(self._format(row + 1, result))
+        self.endInsertRows()
+    
+    def finish(self):
+        """Завершение вывода результатов: пустой результат отмечается строкой EMPTY_TEXT"""
+        if not self._texts:
+            self.beginInsertRows(QModelIndex(), 0, 0)
+            self._texts.append(self.EMPTY_TEXT)
+            self.endInsertRows()
+    
+    def _format(self, rank, result):
+        return self.RESULT_TEXT.format(rank, result.document.title, result.score,
+                                       ', '.join(result.matched_keywords))
+
+
 class SearchResultsWidget(QWidget):
     """Виджет для отображения результатов поиска"""
     
@@ -148,10 +586,22 @@ class SearchResultsWidget(QWidget):
         header_label.setFont(QFont("Arial", 12, QFont.Bold))
         layout.addWidget(header_label)
         
+        # Уточнение: фильтрация уже найденных результатов без повторного поиска
+        self.refine_edit = QLineEdit()
+        self.refine_edit.setPlaceholderText("Уточнить среди результатов...")
+        layout.addWidget(self.refine_edit)
+        
         # Список результатов
-        self.results_list = QListWidget()
+        self.results_model = SearchResultsModel(self)
+        self._proxy = QSortFilterProxyModel(self)
+        self._proxy.setSourceModel(self.results_model)
+        self._proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.refine_edit.textChanged.connect(self._proxy.setFilterFixedString)
+        
+        self.results_list = QListView()
         self.results_list.setAlternatingRowColors(True)
-        self.results_list.itemDoubleClicked.connect(self.on_item_double_clicked)
+        self.results_list.setModel(self._proxy)
+        self.results_list.doubleClicked.connect(self.on_item_double_clicked)
         layout.addWidget(self.results_list)
         
         # Область для отображения содержимого документа
@@ -160,61 +610,153 @@ class SearchResultsWidget(QWidget):
         self.content_area.setMaximumHeight(200)
         layout.addWidget(self.content_area)
         
-        self.setLayout(layout)
+        # Готовые документы фрагментов: id(result) -> QTextDocument. Повторный показ
+        # фрагмента подменяет документ области без повторной разметки текста.
+        # Пустой документ принадлежит виджету результатов, а не QTextEdit:
+        # setDocument удаляет собственный документ области, а этот должен пережить подмену
+        self._default_document = QTextDocument(self)
+        self._default_document.setDefaultFont(self.content_area.font())
+        self.content_area.setDocument(self._default_document)
+        self._doc_cache = {}
         
-        # Хранилище результатов
-        self.search_results = []
+        self.setLayout(layout)
+    
+    @property
+    def search_results(self):
+        """Текущие результаты поиска"""
+        return self.results_model.results()
     
     def display_results(self, results):
         """Отображение результатов поиска"""
-        self.search_results = results
-        self.results_list.clear()
-        self.content_area.clear()
-        
-        if not results:
-            item = QListWidgetItem("Результаты не найдены")
-            item.setData(Qt.UserRole, None)
-            self.results_list.addItem(item)
-            return
-        
-        for i, result in enumerate(results, 1):
-            # Создаем текст для элемента списка
-            text = f"{i}. {result.document.title}\n"
-            text += f"   Релевантность: {result.score:.4f}\n"
-            text += f"   Ключевые слова: {', '.join(result.matched_keywords)}"
-            
-            item = QListWidgetItem(text)
-            item.setData(Qt.UserRole, result)
-            self.results_list.addItem(item)
+        self._reset_content_area()
+        self.results_model.set_results(results)
+    
+    def clear_results(self):
+        """Очистка списка результатов"""
+        self.results_model.clear()
+        self._reset_content_area()
+    
+    def _reset_content_area(self):
+        """Очистка области фрагмента и кэша документов фрагментов"""
+        self.content_area.setDocument(self._default_document)
+        self._default_document.clear()
+        for document in self._doc_cache.values():
+            document.deleteLater()
+        self._doc_cache.clear()
+    
+    def append_result(self, result):
+        """Добавление очередного результата в конец списка"""
+        self.results_model.append_result(result)
     
-    def on_item_double_clicked(self, item):
+    def finish_results(self):
+        """Завершение вывода результатов"""
+        self.results_model.finish()
+    
+    def on_item_double_clicked(self, index):
         """Обработка двойного клика по результату"""
-        result = item.data(Qt.UserRole)
+        result = index.data(Qt.UserRole)
         if result:
-            self.content_area.setPlainText(result.snippet)
+            key = id(result)
+            document = self._doc_cache.get(key)
+            if document is None:
+                document = QTextDocument(self)
+                document.setDefaultFont(self.content_area.font())
+                document.setPlainText(result.snippet)
+                self._doc_cache[key] = document
+            self.content_area.setDocument(document)
     
     def get_selected_result(self):
         """Получение выбранного результата"""
-        current_item = self.results_list.currentItem()
-        if current_item:
-            return current_item.data(Qt.UserRole)
+        current_index = self.results_list.currentIndex()
+        if current_index.isValid():
+            return current_index.data(Qt.UserRole)
         return None
 
 
 class MainWindow(QMainWindow):
     """Главное окно приложения"""
     
+    # Запрос поиска у исполнителя: (поколение, запрос, top_k, min_score)
+    request_search = pyqtSignal(int, str, int, float)
+    
     def __init__(self):
         super().__init__()
-        self.search_engine = SearchEngine()
-        self.search_worker = None
+        # Поисковая система создается в фоновом потоке (см. EngineLoader);
+        # обработчик текста создается один раз и передается ей
+        self.text_processor = TextProcessor()
+        self.search_engine = None
+        
+        # Поколение поиска: ответы предыдущих поколений отбрасываются
+        self._search_gen = 0
+        self._results_started = False
+        
+        # Номер последнего запроса статистики: устаревшие ответы не отображаются
+        self._stats_gen = 0
+        
+        # Семантический кэш близких запросов (сохраняется между запусками)
+        self.semantic_cache = SemanticCache()
+        self.query_store = None
+        
+        # Один поток поиска на все время работы окна; запросы передаются сигналом
+        self._search_thread = QThread(self)
+        self.search_worker = SearchWorker(self.search_engine, self.semantic_cache)
+        self.search_worker.moveToThread(self._search_thread)
+        self.request_search.connect(self.search_worker.do_search, Qt.QueuedConnection)
+        self.search_worker.result_ready.connect(self.on_result_ready)
+        self.search_worker.search_finished.connect(self.on_search_finished)
+        self.search_worker.search_error.connect(self.on_search_error)
+        self._search_thread.start()
         
         self.setup_ui()
         self.setup_menu()
         self.setup_status_bar()
         
-        # Обновляем статистику
+        # Окно отображается сразу, а поисковая система загружается в фоне
+        self.set_engine_controls_enabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, 0)
+        self.status_bar.showMessage("Загрузка поисковой системы...")
+        
+        self._engine_loader = EngineLoader(self.text_processor)
+        self._engine_loader.ready.connect(self._on_engine_ready)
+        self._engine_loader.failed.connect(self._on_engine_failed)
+        self._engine_loader.start()
+    
+    def _on_engine_ready(self, engine):
+        """Подключение загруженной поисковой системы"""
+        self.search_engine = engine
+        self.search_worker.search_engine = engine
+        
+        # Хранимый кэш запросов: записи текущей эпохи сразу наполняют семантический кэш
+        try:
+            query_store = PersistentQueryCache(engine.document_manager.data_dir / QUERY_CACHE_FILE)
+            query_store.open_for(_documents_fingerprint(engine))
+            for vector, params, entries in query_store.entries():
+                self.semantic_cache.add(vector, params, entries)
+            self.query_store = query_store
+            self.search_worker.query_store = query_store
+        except Exception as e:
+            logger.error("Ошибка при загрузке кэша запросов: %s", e)
+        
+        self.documents_model.search_engine = engine
+        self.update_documents_list()
         self.update_statistics()
+        
+        self.progress_bar.setVisible(False)
+        self.set_engine_controls_enabled(True)
+        self.status_bar.showMessage("Готов к работе")
+    
+    def _on_engine_failed(self, error_message):
+        """Обработка ошибки загрузки поисковой системы"""
+        self.progress_bar.setVisible(False)
+        self.status_bar.showMessage("Ошибка загрузки поисковой системы")
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить поисковую систему: {error_message}")
+    
+    def set_engine_controls_enabled(self, enabled):
+        """Включение элементов управления, которым нужна поисковая система"""
+        for control in (self.search_button, self.add_doc_button, self.delete_doc_button,
+                        self.rebuild_index_button, self.add_action, self.rebuild_action):
+            control.setEnabled(enabled)
     
     def setup_ui(self):
         """Настройка пользовательского интерфейса"""
@@ -262,6 +804,12 @@ class MainWindow(QMainWindow):
         self.search_input.returnPressed.connect(self.perform_search)
         search_layout.addWidget(self.search_input)
         
+        # Поиск при вводе: серия нажатий клавиш объединяется в один запрос
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.timeout.connect(self.perform_debounced_search)
+        self.search_input.textChanged.connect(lambda _: self._search_timer.start(200))
+        
         # Кнопки поиска
         button_layout = QHBoxLayout()
         
@@ -361,15 +909,14 @@ class MainWindow(QMainWindow):
         header_label.setFont(QFont("Arial", 12, QFont.Bold))
         layout.addWidget(header_label)
         
-        # Список документов
-        self.documents_list = QListWidget()
+        # Список документов: строки подгружаются по мере прокрутки
+        self.documents_model = DocumentListModel(self.search_engine, self)
+        self.documents_list = QListView()
         self.documents_list.setAlternatingRowColors(True)
-        self.documents_list.itemDoubleClicked.connect(self.on_document_double_clicked)
+        self.documents_list.setModel(self.documents_model)
+        self.documents_list.doubleClicked.connect(self.on_document_double_clicked)
         layout.addWidget(self.documents_list)
         
-        # Обновляем список документов
-        self.update_documents_list()
-        
         return widget
     
     def setup_menu(self):
@@ -379,9 +926,9 @@ class MainWindow(QMainWindow):
         # Меню "Файл"
         file_menu = menubar.addMenu('Файл')
         
-        add_action = QAction('Добавить документ', self)
-        add_action.triggered.connect(self.add_document)
-        file_menu.addAction(add_action)
+        self.add_action = QAction('Добавить документ', self)
+        self.add_action.triggered.connect(self.add_document)
+        file_menu.addAction(self.add_action)
         
         file_menu.addSeparator()
         
@@ -392,9 +939,9 @@ class MainWindow(QMainWindow):
         # Меню "Инструменты"
         tools_menu = menubar.addMenu('Инструменты')
         
-        rebuild_action = QAction('Перестроить индекс', self)
-        rebuild_action.triggered.connect(self.rebuild_index)
-        tools_menu.addAction(rebuild_action)
+        self.rebuild_action = QAction('Перестроить индекс', self)
+        self.rebuild_action.triggered.connect(self.rebuild_index)
+        tools_menu.addAction(self.rebuild_action)
         
         # Меню "Справка"
         help_menu = menubar.addMenu('Справка')
@@ -416,104 +963,80 @@ class MainWindow(QMainWindow):
         self.status_bar.showMessage("Готов к работе")
     
     def apply_styles(self):
-        """Применение стилей к интерфейсу"""
-        style = """
-        QMainWindow {
-            background-color: #f0f0f0;
-        }
-        QGroupBox {
-            font-weight: bold;
-            border: 2px solid #cccccc;
-            border-radius: 5px;
-            margin-top: 1ex;
-            padding-top: 10px;
-        }
-        QGroupBox::title {
-            subcontrol-origin: margin;
-            left: 10px;
-            padding: 0 5px 0 5px;
-        }
-        QPushButton {
-            background-color: #4CAF50;
-            border: none;
-            color: white;
-            padding: 8px 16px;
-            text-align: center;
-            font-size: 14px;
-            border-radius: 4px;
-        }
-        QPushButton:hover {
-            background-color: #45a049;
-        }
-        QPushButton:pressed {
-            background-color: #3d8b40;
-        }
-        QLineEdit, QTextEdit {
-            border: 1px solid #ddd;
-            border-radius: 4px;
-            padding: 5px;
-        }
-        QLineEdit:focus, QTextEdit:focus {
-            border: 2px solid #4CAF50;
-        }
-        QListWidget {
-            border: 1px solid #ddd;
-            border-radius: 4px;
-            background-color: white;
-        }
-        QListWidget::item {
-            padding: 5px;
-            border-bottom: 1px solid #eee;
-        }
-        QListWidget::item:selected {
-            background-color: #4CAF50;
-            color: white;
-        }
-        QListWidget::item:hover {
-            background-color: #f0f8ff;
-        }
-        """
-        self.setStyleSheet(style)
+        """Применение стилей к интерфейсу (таблица стилей задается приложению один раз)"""
+        app = QApplication.instance()
+        if app is not None and app.styleSheet() != _APP_STYLE:
+            app.setStyleSheet(_APP_STYLE)
+    
+    def perform_debounced_search(self):
+        """Поиск по паузе во вводе (пустой запрос пропускается без предупреждения)"""
+        if self.search_engine is not None and self.search_input.text().strip():
+            self.perform_search()
     
     def perform_search(self):
         """Выполнение поиска"""
+        self._search_timer.stop()
+        
+        # Поиск недоступен до окончания загрузки поисковой системы
+        if self.search_engine is None:
+            return
+        
         query = self.search_input.text().strip()
         if not query:
             QMessageBox.warning(self, "Предупреждение", "Введите поисковый запрос")
             return
         
+        # Выполняющийся поиск прерывается: его результат уже не нужен
+        self._search_gen += 1
+        self.search_worker.latest_generation = self._search_gen
+        # Прежние результаты остаются на экране до прихода первого нового
+        self._results_started = False
+        
         # Показываем прогресс
         self.progress_bar.setVisible(True)
         self.progress_bar.setRange(0, 0)  # Неопределенный прогресс
         self.search_button.setEnabled(False)
         self.status_bar.showMessage("Выполняется поиск...")
         
-        # Запускаем поиск в отдельном потоке
-        self.search_worker = SearchWorker(
-            self.search_engine,
+        # Передаем запрос в поток поиска
+        self.request_search.emit(
+            self._search_gen,
             query,
             self.top_k_spinbox.value(),
             self.min_score_spinbox.value()
         )
-        self.search_worker.search_completed.connect(self.on_search_completed)
-        self.search_worker.search_error.connect(self.on_search_error)
-        self.search_worker.start()
     
-    def on_search_completed(self, results):
+    def on_result_ready(self, generation, result):
+        """Обработка очередного результата поиска"""
+        if generation != self._search_gen:
+            return
+        
+        if not self._results_started:
+            self._results_started = True
+            self.search_results_widget.clear_results()
+            self.tab_widget.setCurrentIndex(0)  # Переключаемся на вкладку результатов
+        
+        self.search_results_widget.append_result(result)
+    
+    def on_search_finished(self, generation, count):
         """Обработка завершения поиска"""
+        if generation != self._search_gen:
+            return
+        
         self.progress_bar.setVisible(False)
         self.search_button.setEnabled(True)
         
-        if results:
-            self.search_results_widget.display_results(results)
-            self.tab_widget.setCurrentIndex(0)  # Переключаемся на вкладку результатов
-            self.status_bar.showMessage(f"Найдено {len(results)} результатов")
+        if count:
+            self.status_bar.showMessage(f"Найдено {count} результатов")
         else:
             self.search_results_widget.display_results([])
             self.status_bar.showMessage("Результаты не найдены")
     
-    def on_search_error(self, error_message):
+    def on_search_error(self, generation, error_message):
         """Обработка ошибки поиска"""
+        if generation != self._search_gen:
+            return
+        
         self.progress_bar.setVisible(False)
         self.search_button.setEnabled(True)
         QMessageBox.critical(self, "Ошибка поиска", f"Произошла ошибка: {error_message}")
@@ -521,7 +1044,14 @@ class MainWindow(QMainWindow):
     
     def clear_search(self):
         """Очистка поиска"""
+        # Результаты выполняющегося поиска больше не нужны
+        self._search_gen += 1
+        self.search_worker.latest_generation = self._search_gen
+        self.progress_bar.setVisible(False)
+        self.search_button.setEnabled(True)
+        
         self.search_input.clear()
+        self._search_timer.stop()
         self.search_results_widget.display_results([])
         self.status_bar.showMessage("Поиск очищен")
     
@@ -537,9 +1067,10 @@ class MainWindow(QMainWindow):
                         content=data['content'],
                         file_path=data['file_path']
                     )
+                    self.invalidate_search_caches()
                     QMessageBox.information(self, "Успех", f"Документ добавлен с ID: {doc_id}")
                     self.update_statistics()
-                    self.update_documents_list()
+                    self.documents_model.add_document(doc_id)
                 except Exception as e:
                     QMessageBox.critical(self, "Ошибка", f"Не удалось добавить документ: {e}")
             else:
@@ -547,12 +1078,12 @@ class MainWindow(QMainWindow):
     
     def delete_document(self):
         """Удаление документа"""
-        current_item = self.documents_list.currentItem()
-        if not current_item:
+        current_index = self.documents_list.currentIndex()
+        if not current_index.isValid():
             QMessageBox.warning(self, "Предупреждение", "Выберите документ для удаления")
             return
         
-        doc_id = current_item.data(Qt.UserRole)
+        doc_id = current_index.data(Qt.UserRole)
         if doc_id:
             reply = QMessageBox.question(
                 self, "Подтверждение", 
@@ -563,9 +1094,10 @@ class MainWindow(QMainWindow):
                 try:
                     success = self.search_engine.remove_document(doc_id)
                     if success:
+                        self.invalidate_search_caches()
                         QMessageBox.information(self, "Успех", "Документ удален")
                         self.update_statistics()
-                        self.update_documents_list()
+                        self.documents_model.remove_document(doc_id)
                     else:
                         QMessageBox.warning(self, "Предупреждение", "Не удалось удалить документ")
                 except Exception as e:
@@ -581,46 +1113,86 @@ class MainWindow(QMainWindow):
         if reply == QMessageBox.Yes:
             try:
                 self.search_engine.rebuild_index()
+                self.invalidate_search_caches()
                 QMessageBox.information(self, "Успех", "Индекс перестроен")
                 self.update_statistics()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Ошибка при перестроении индекса: {e}")
     
+    def start_index_warm_up(self):
+        """Фоновый пересчет весов индекса"""
+        threading.Thread(target=self.search_engine.warm_up, daemon=True).start()
+    
+    def invalidate_search_caches(self):
+        """Сброс кэшей поиска после изменения документов или индекса"""
+        self.semantic_cache.clear()
+        if self.query_store is not None:
+            self.query_store.bump_epoch()
+        self.start_index_warm_up()
+    
+    def closeEvent(self, event):
+        """Остановка потока поиска и закрытие кэша запросов при закрытии окна"""
+        self._search_gen += 1
+        self.search_worker.latest_generation = self._search_gen
+        self._search_thread.quit()
+        self._search_thread.wait()
+        
+        # Загрузка поисковой системы не прерывается, дожидаемся ее окончания
+        self._engine_loader.wait()
+        
+        # Текущая эпоха привязывается к нынешнему состоянию документов без сброса
+        # записей, чтобы следующий запуск с теми же документами принял их
+        if self.query_store is not None:
+            try:
+                self.query_store.save_fingerprint(_documents_fingerprint(self.search_engine))
+                self.query_store.close()
+            except Exception as e:
+                logger.error("Ошибка при сохранении кэша запросов: %s", e)
+        super().closeEvent(event)
+    
     def update_statistics(self):
-        """Обновление статистики"""
-        try:
-            stats = self.search_engine.get_stats()
-            doc_stats = stats['documents']
-            index_stats = stats['index']
-            
-            stats_text = f"""
+        """Обновление статистики (подсчет выполняется в пуле потоков)"""
+        if self.search_engine is None:
+            return
+        
+        self._stats_gen += 1
+        worker = StatsWorker(self.search_engine, self._stats_gen)
+        worker.signals.done.connect(self.on_stats_ready)
+        worker.signals.failed.connect(self.on_stats_failed)
+        QThreadPool.globalInstance().start(worker)
+    
+    def on_stats_ready(self, generation, stats):
+        """Отображение подсчитанной статистики"""
+        if generation != self._stats_gen:
+            return
+        
+        doc_stats = stats['documents']
+        index_stats = stats['index']
+        
+        stats_text = f"""
 Документов: {doc_stats['total_documents']}
 Уникальных слов: {index_stats['unique_words']}
 Среднее слов в документе: {index_stats['average_words_per_document']:.1f}
 Общий размер: {doc_stats['total_characters']} символов
-            """.strip()
-            
-            self.stats_label.setText(stats_text)
-        except Exception as e:
-            self.stats_label.setText(f"Ошибка загрузки статистики: {e}")
+        """.strip()
+        
+        self.stats_label.setText(stats_text)
+    
+    def on_stats_failed(self, generation, error_message):
+        """Обработка ошибки подсчета статистики"""
+        if generation == self._stats_gen:
+            self.stats_label.setText(f"Ошибка загрузки статистики: {error_message}")
     
     def update_documents_list(self):
         """Обновление списка документов"""
-        self.documents_list.clear()
-        
         try:
-            documents = self.search_engine.document_manager.get_all_documents()
-            for doc in documents:
-                item_text = f"{doc.title}\nID: {doc.doc_id}\nСимволов: {len(doc.content)}"
-                item = QListWidgetItem(item_text)
-                item.setData(Qt.UserRole, doc.doc_id)
-                self.documents_list.addItem(item)
+            self.documents_model.reload()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить документы: {e}")
     
-    def on_document_double_clicked(self, item):
+    def on_document_double_clicked(self, index):
         """Обработка двойного клика по документу"""
-        doc_id = item.data(Qt.UserRole)
+        doc_id = index.data(Qt.UserRole)
         if doc_id:
             doc = self.search_engine.get_document(doc_id)
             if doc:
@@ -667,6 +1239,7 @@ def main():
     app = QApplication(sys.argv)
     app.setApplicationName("Система семантического поиска")
     app.setApplicationVersion("1.0")
+    app.setStyleSheet(_APP_STYLE)
     
     # Создаем главное окно
     window = MainWindow()
@@ -0,0 +1,153 @@
+"""
+Хранимый на диске кэш запросов (SQLite)
+"""
+
+import hashlib
+import json
+import sqlite3
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class PersistentQueryCache:
+    """
+    Кэш векторов и результатов запросов, сохраняемый между запусками
+
+    Ключ записи - blake2b от эпохи индекса, запроса и параметров поиска. Эпоха
+    увеличивается при любом изменении документов или индекса, поэтому сброс кэша
+    не требует перебора записей: записи прежних эпох просто перестают находиться
+    и удаляются при следующем открытии.
+
+    Веса векторов хранятся в половинной точности (float16): для сравнения
+    запросов по косинусной мере ее достаточно.
+    """
+
+    # Размер области файла базы, отображаемой в память
+    MMAP_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size={self.MMAP_SIZE}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "key TEXT PRIMARY KEY, epoch INTEGER, words TEXT, weights BLOB, params TEXT, results TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+        self.epoch = int(self._get_meta('epoch') or 0)
+
+    def open_for(self, fingerprint: str):
+        """
+        Привязка кэша к состоянию документов
+
+        Если документы изменились с прошлого запуска, эпоха увеличивается.
+        Записи прежних эпох удаляются.
+        """
+        with self._lock:
+            if self._get_meta('fingerprint') != fingerprint:
+                self._bump_epoch()
+                self._set_meta('fingerprint', fingerprint)
+            self._conn.execute("DELETE FROM queries WHERE epoch != ?", (self.epoch,))
+            self._conn.commit()
+
+    def save_fingerprint(self, fingerprint: str):
+        """
+        Запоминание отпечатка документов для текущей эпохи
+
+        Записи текущей эпохи соответствуют этому состоянию документов и будут
+        приняты следующим open_for с тем же отпечатком.
+        """
+        with self._lock:
+            self._set_meta('fingerprint', fingerprint)
+            self._conn.commit()
+
+    def bump_epoch(self):
+        """Сброс кэша после изменения документов или индекса"""
+        with self._lock:
+            self._bump_epoch()
+            self._conn.commit()
+
+    def get(self, query: str, params: Tuple[Any, ...]) -> Optional[Tuple[Dict[str, float], List[Any]]]:
+        """Вектор и результаты запроса текущей эпохи"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT words, weights, results FROM queries WHERE key = ?",
+                (self._key(query, params),)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        words, weights, results = row
+        return _unpack_vector(words, weights), json.loads(results)
+
+    def put(self, query: str, params: Tuple[Any, ...], vector: Dict[str, float], results: List[Any],
+            epoch: Optional[int] = None):
+        """
+        Сохранение вектора и результатов запроса
+
+        epoch - эпоха на момент начала поиска: если за время поиска эпоха
+        сменилась (документы изменились), устаревшие результаты не сохраняются.
+        """
+        try:
+            words, weights = _pack_vector(vector)
+        except (struct.error, OverflowError):
+            # Веса вне диапазона float16 не сохраняются
+            return
+
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(query, params), self.epoch, words, weights,
+                 json.dumps(list(params)), json.dumps(results, ensure_ascii=False))
+            )
+            self._conn.commit()
+
+    def entries(self) -> Iterator[Tuple[Dict[str, float], Tuple[Any, ...], List[Any]]]:
+        """Все записи текущей эпохи: (вектор, параметры, результаты)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT words, weights, params, results FROM queries WHERE epoch = ?",
+                (self.epoch,)
+            ).fetchall()
+
+        for words, weights, params, results in rows:
+            yield _unpack_vector(words, weights), tuple(json.loads(params)), json.loads(results)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _key(self, query: str, params: Tuple[Any, ...]) -> str:
+        raw = '\0'.join([str(self.epoch), query] + [repr(param) for param in params])
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _bump_epoch(self):
+        self.epoch += 1
+        self._set_meta('epoch', str(self.epoch))
+
+    def _get_meta(self, name: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name: str, value: str):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, value))
+
+
+def _pack_vector(vector: Dict[str, float]) -> Tuple[str, bytes]:
+    """Упаковка вектора: слова через пробел и веса в float16"""
+    words = list(vector)
+    weights = struct.pack(f'<{len(words)}e', *(vector[word] for word in words))
+    return ' '.join(words), weights
+
+
+def _unpack_vector(words: str, weights: bytes) -> Dict[str, float]:
+    """Распаковка вектора, сохраненного _pack_vector"""
+    word_list = words.split()
+    return dict(zip(word_list, struct.unpack(f'<{len(word_list)}e', weights)))
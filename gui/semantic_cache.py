@@ -0,0 +1,131 @@
+"""
+Семантический кэш результатов поиска для близких запросов
+"""
+
+import math
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class SemanticCache:
+    """
+    Кэш результатов поиска по близости векторов запросов
+
+    Запрос считается повторным, если косинусное сходство его вектора с вектором
+    одного из сохраненных запросов не ниже порога. Кандидаты выбираются через
+    инвертированный индекс по словам запроса, поэтому сравнение идет только
+    с запросами, имеющими общие слова.
+
+    Веса сохраненных векторов квантуются в int8 с масштабом на вектор
+    (максимальный по модулю вес переходит в 127): для сравнения запросов
+    по косинусной мере этой точности достаточно, а запись занимает в несколько
+    раз меньше памяти, чем словарь весов.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        # Записи кэша: слова векторов, квантованные веса и их масштабы,
+        # нормы векторов, параметры поиска и результаты
+        self._words: List[Tuple[str, ...]] = []
+        self._codes: List[array] = []
+        self._scales: List[float] = []
+        self._norms: List[float] = []
+        self._params: List[Tuple[Any, ...]] = []
+        self._values: List[Any] = []
+
+        # Инвертированный индекс: слово -> номера записей
+        self._buckets: Dict[str, List[int]] = {}
+
+        # Поколение кэша: увеличивается при каждой очистке (см. add)
+        self.generation = 0
+
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def lookup(self, vector: Dict[str, float], params: Tuple[Any, ...]) -> Optional[Any]:
+        """Поиск результатов ближайшего сохраненного запроса с теми же параметрами"""
+        norm = _vector_norm(vector)
+        if norm == 0:
+            return None
+
+        with self._lock:
+            candidates = set()
+            for word in vector:
+                candidates.update(self._buckets.get(word, ()))
+
+            best_value = None
+            best_similarity = self.threshold
+            for entry in candidates:
+                if self._params[entry] != params:
+                    continue
+
+                dot_product = sum(vector.get(word, 0.0) * code
+                                  for word, code in zip(self._words[entry], self._codes[entry]))
+                similarity = dot_product * self._scales[entry] / (norm * self._norms[entry])
+                if similarity >= best_similarity:
+                    best_similarity = similarity
+                    best_value = self._values[entry]
+
+            return best_value
+
+    def add(self, vector: Dict[str, float], params: Tuple[Any, ...], value: Any,
+            generation: Optional[int] = None):
+        """
+        Сохранение результатов запроса
+
+        generation - поколение кэша на момент начала поиска: если кэш был очищен
+        за время поиска, результаты относятся к прежним документам и не сохраняются.
+        """
+        words = tuple(vector)
+        max_abs = max((abs(vector[word]) for word in words), default=0.0)
+        if max_abs == 0:
+            return
+
+        scale = max_abs / 127
+        codes = array('b', (round(vector[word] / scale) for word in words))
+        # Норма считается по квантованным весам, чтобы косинусная мера
+        # сохраненного вектора с самим собой оставалась равной 1
+        norm = math.sqrt(sum(code * code for code in codes)) * scale
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            # При переполнении кэш начинается заново
+            if len(self._words) >= self.max_entries:
+                self._reset()
+
+            entry = len(self._words)
+            self._words.append(words)
+            self._codes.append(codes)
+            self._scales.append(scale)
+            self._norms.append(norm)
+            self._params.append(tuple(params))
+            self._values.append(value)
+            for word in vector:
+                self._buckets.setdefault(word, []).append(entry)
+
+    def clear(self):
+        """Очистка кэша (при изменении документов или индекса)"""
+        with self._lock:
+            self.generation += 1
+            self._reset()
+
+    def _reset(self):
+        self._words = []
+        self._codes = []
+        self._scales = []
+        self._norms = []
+        self._params = []
+        self._values = []
+        self._buckets = {}
+
+
+def _vector_norm(vector: Dict[str, float]) -> float:
+    """Норма вектора запроса"""
+    return math.sqrt(sum(weight * weight for weight in vector.values()))
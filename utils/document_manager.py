@@ -3,24 +3,144 @@
 """
 
 import os
+import re
+import sys
 import json
+import mmap
+import logging
+import atexit
+import hashlib
+import threading
+import time
+import weakref
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Set, Tuple, FrozenSet, Union
 from datetime import datetime
 
 
+logger = logging.getLogger(__name__)
+
+# Начало снимка в формате, который пишет DocumentManager: {"documents": [
+_SNAPSHOT_HEAD_RE = re.compile(r'\s*\{\s*"documents"\s*:\s*\[')
+# Разделители между документами в массиве снимка
+_SEPARATORS_RE = re.compile(r'[\s,]*')
+# Размер блока при потоковом чтении снимка
+SNAPSHOT_READ_SIZE = 1 << 20
+# Кодировщик JSON снимка и журнала: компактный, с кириллицей без экранирования
+_encode_json = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+# Кодировка содержимого документов в памяти и в файле содержимого
+CONTENT_ENCODING = 'utf-8'
+# Содержимое от этого размера (в байтах UTF-8) сжимается zlib в файле содержимого
+CONTENT_COMPRESS_MIN_SIZE = 512
+CONTENT_COMPRESSION_LEVEL = 6
+# Строки метаданных не длиннее этого интернируются при загрузке
+INTERN_MAX_LENGTH = 64
+# С этого числа документов хэши содержимого при загрузке считаются в пуле потоков
+PARALLEL_LOAD_THRESHOLD = 1024
+# Фрагменты запроса короче этого ищутся сканированием строки заголовков, а не по индексу
+# триграмм: у более короткого фрагмента нет ни одной триграммы
+TITLE_INDEX_MIN_FRAGMENT = 3
+# Разделитель заголовков в общей строке заголовков
+_TITLE_SEPARATOR = '\x00'
+
+
 class Document:
     """Класс для представления документа"""
     
-    def __init__(self, doc_id: str, title: str, content: str, 
-                 file_path: Optional[str] = None, metadata: Optional[Dict] = None):
+    # Атрибуты хранятся в слотах: у документа нет собственного __dict__
+    __slots__ = ('doc_id', 'title', 'title_lower', '_content', '_store', '_offset', '_size',
+                 '_compressed', 'content_len', 'content_hash', '_file_dir', '_file_name',
+                 '_metadata', 'created_at',
+                 'processed_content', 'token_set')
+    
+    def __init__(self, doc_id: str, title: str, content: Union[str, bytes], 
+                 file_path: Optional[str] = None, metadata: Optional[Dict] = None,
+                 created_at: Optional[str] = None):
         self.doc_id = doc_id
         self.title = title
-        self.content = content
+        # Заголовок в нижнем регистре (для поиска по заголовку)
+        self.title_lower = title.lower()
+        # Длина содержимого в символах (для статистики без обращения к строке)
+        if isinstance(content, str):
+            self.content_len = len(content)
+            content = content.encode(CONTENT_ENCODING)
+        else:
+            self.content_len = len(content.decode(CONTENT_ENCODING))
+        # Содержимое хранится байтами в CONTENT_ENCODING, пока не записано в файл
+        # содержимого; после записи оно читается из отображенного в память файла.
+        # Строка создается только при обращении к content
+        self._content: Optional[bytes] = content
+        self._store: Optional['_ContentStore'] = None
+        self._offset = 0
+        self._size = 0
+        self._compressed = False
+        # Хэш содержимого (blake2b, 16 байт); заполняет DocumentManager
+        self.content_hash: Optional[bytes] = None
         self.file_path = file_path
-        self.metadata = metadata or {}
-        self.created_at = datetime.now().isoformat()
+        # Пустые метаданные не хранятся: словарь создается при первом обращении.
+        # Ключи и короткие значения метаданных интернируются
+        self._metadata = _intern_metadata(metadata) or None
+        self.created_at = created_at or datetime.now().isoformat()
         self.processed_content = ""
+        # Слова обработанного содержимого: разбиваются один раз при обновлении
+        self.token_set: FrozenSet[str] = frozenset()
+    
+    @property
+    def content(self) -> str:
+        return self.content_bytes().decode(CONTENT_ENCODING)
+    
+    def content_bytes(self) -> bytes:
+        """Содержимое в CONTENT_ENCODING (без декодирования в строку)"""
+        if self._content is not None:
+            return self._content
+        data = self._store.read(self)
+        return zlib.decompress(data) if self._compressed else data
+    
+    def _attach_content(self, store: '_ContentStore', offset: int, size: int,
+                        compressed: bool = False):
+        """Переход к чтению содержимого из файла содержимого"""
+        self._store = store
+        self._offset = offset
+        self._size = size
+        self._compressed = compressed
+        self._content = None
+    
+    @property
+    def file_path(self) -> Optional[str]:
+        if self._file_dir is None:
+            return None
+        return self._file_dir + self._file_name
+    
+    @file_path.setter
+    def file_path(self, value: Optional[str]):
+        # Путь хранится интернированной директорией и именем файла:
+        # документы из одной директории разделяют одну строку директории
+        if value is None:
+            self._file_dir = self._file_name = None
+            return
+        split = max(value.rfind('/'), value.rfind('\\')) + 1
+        self._file_dir = sys.intern(value[:split])
+        self._file_name = value[split:]
+    
+    @property
+    def metadata(self) -> Dict:
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+    
+    @metadata.setter
+    def metadata(self, value: Optional[Dict]):
+        self._metadata = _intern_metadata(value) or None
+    
+    def set_processed_content(self, processed_content: str,
+                              tokens: Optional[Sequence[str]] = None):
+        """Установка обработанного содержимого вместе с его словами"""
+        self.processed_content = processed_content
+        self.token_set = frozenset(processed_content.split() if tokens is None else tokens)
     
     def to_dict(self) -> Dict[str, Any]:
         """Преобразование документа в словарь"""
@@ -29,89 +149,581 @@ class Document:
             'title': self.title,
             'content': self.content,
             'file_path': self.file_path,
-            'metadata': self.metadata,
+            'metadata': self._metadata or {},
             'created_at': self.created_at,
             'processed_content': self.processed_content
         }
     
+    def _to_record(self) -> Dict[str, Any]:
+        """
+        Запись документа для снимка и журнала: содержимое - ссылкой в файл содержимого
+
+        Хэш содержимого сохраняется в записи, чтобы при загрузке не читать
+        и не распаковывать содержимое всех документов. Обработанное содержимое
+        не сохраняется: поисковая система заново получает его из содержимого
+        при загрузке.
+        """
+        if self._store is None:
+            record = self.to_dict()
+            del record['processed_content']
+        else:
+            record = {
+                'doc_id': self.doc_id,
+                'title': self.title,
+                'content_offset': self._offset,
+                'content_size': self._size,
+                'content_len': self.content_len,
+                'file_path': self.file_path,
+                'metadata': self._metadata or {},
+                'created_at': self.created_at
+            }
+            if self._compressed:
+                record['content_codec'] = 'zlib'
+        if self.content_hash is not None:
+            record['content_hash'] = self.content_hash.hex()
+        return record
+    
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'Document':
-        """Создание документа из словаря"""
-        doc = cls(
-            doc_id=data['doc_id'],
-            title=data['title'],
-            content=data['content'],
-            file_path=data.get('file_path'),
-            metadata=data.get('metadata', {})
-        )
-        doc.created_at = data.get('created_at', datetime.now().isoformat())
-        doc.processed_content = data.get('processed_content', "")
+    def from_dict(cls, data: Dict[str, Any], store: Optional['_ContentStore'] = None,
+                  lower_title: bool = True) -> 'Document':
+        """
+        Создание документа из словаря (или записи со ссылкой в файл содержимого store)
+
+        При lower_title=False заголовок в нижнем регистре не вычисляется: при загрузке
+        его заполняет DocumentManager сразу для всех документов.
+        """
+        # Документ собирается напрямую по слотам, минуя __init__: при загрузке
+        # большого корпуса это основной цикл, и значения по умолчанию в нем не нужны
+        doc = cls.__new__(cls)
+        doc.doc_id = data['doc_id']
+        title = data['title']
+        doc.title = title
+        doc.title_lower = title.lower() if lower_title else ""
+        if 'content' in data:
+            content = data['content']
+            doc._content = content.encode(CONTENT_ENCODING)
+            doc._store = None
+            doc._offset = 0
+            doc._size = 0
+            doc._compressed = False
+            doc.content_len = len(content)
+        else:
+            doc._content = None
+            doc._store = store
+            doc._offset = data['content_offset']
+            doc._size = data['content_size']
+            doc._compressed = data.get('content_codec') == 'zlib'
+            doc.content_len = data['content_len']
+        content_hash = data.get('content_hash')
+        doc.content_hash = bytes.fromhex(content_hash) if content_hash else None
+        doc.file_path = data.get('file_path')
+        doc._metadata = _intern_metadata(data.get('metadata')) or None
+        doc.created_at = data.get('created_at') or datetime.now().isoformat()
+        doc.set_processed_content(data.get('processed_content', ""))
         return doc
 
 
+class _ContentStore:
+    """
+    Файл содержимого документов, отображаемый в память
+
+    Содержимое дописывается в конец файла в CONTENT_ENCODING (большое - сжатым zlib),
+    документы хранят смещение и размер. Место удаленных документов освобождается
+    при сжатии: живое содержимое переписывается в новый файл, который подменяет прежний.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fp = None
+        self._mm: Optional[mmap.mmap] = None
+        # Размер файла (поддерживается при дописывании)
+        self.size = path.stat().st_size if path.exists() else 0
+    
+    def append(self, data: bytes) -> int:
+        """Запись содержимого в конец файла, возвращает смещение"""
+        with self._lock:
+            fp = self._open()
+            offset = fp.seek(0, os.SEEK_END)
+            fp.write(data)
+            fp.flush()
+            self.size = offset + len(data)
+            return offset
+    
+    def read(self, doc: 'Document') -> bytes:
+        """Чтение содержимого документа (смещение берется под блокировкой: сжатие его меняет)"""
+        with self._lock:
+            return self._read(doc._offset, doc._size)
+    
+    def write_compacted(self, path: Path, documents: List['Document']):
+        """Запись содержимого документов подряд, в их порядке, в новый файл"""
+        with self._lock, open(path, 'wb') as f:
+            for doc in documents:
+                f.write(self._read(doc._offset, doc._size))
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def replace(self, path: Path, documents: List['Document'], offsets: List[int]):
+        """Подмена файла сжатым (см. write_compacted) и перенос документов на новые смещения"""
+        with self._lock:
+            self._close()
+            os.replace(path, self.path)
+            for doc, offset in zip(documents, offsets):
+                doc._offset = offset
+            self.size = self.path.stat().st_size
+    
+    def sync(self):
+        """Сброс файла на диск (перед записью снимка, ссылающегося на него)"""
+        with self._lock:
+            if self._fp is not None:
+                os.fsync(self._fp.fileno())
+    
+    def close(self):
+        with self._lock:
+            self._close()
+    
+    def _read(self, offset: int, size: int) -> bytes:
+        if size == 0:
+            return b""
+        # Отображение обновляется, если содержимое дописано после него
+        if self._mm is None or offset + size > len(self._mm):
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mmap.mmap(self._open().fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm[offset:offset + size]
+    
+    def _close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+    
+    def _open(self):
+        if self._fp is None:
+            self._fp = open(self.path, 'a+b')
+        return self._fp
+
+
+class _TitleTrigrams:
+    """
+    Индекс триграмм слов заголовков
+
+    Для каждой триграммы хранятся слова, в которые она входит. Слова, содержащие
+    фрагмент, - это пересечение множеств триграмм фрагмента с проверкой вхождения.
+    Память индекса линейна по суммарной длине различных слов, а пустые множества
+    удаляются вместе с последним словом.
+    """
+    
+    def __init__(self):
+        self._words: Dict[str, Set[str]] = {}
+    
+    def add(self, word: str):
+        """Добавление слова"""
+        for trigram in _trigrams(word):
+            self._words.setdefault(trigram, set()).add(word)
+    
+    def remove(self, word: str):
+        """Удаление слова"""
+        for trigram in _trigrams(word):
+            words = self._words.get(trigram)
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del self._words[trigram]
+    
+    def words_containing(self, fragment: str) -> Set[str]:
+        """Слова, содержащие фрагмент (не короче трех символов)"""
+        word_sets = []
+        for trigram in _trigrams(fragment):
+            words = self._words.get(trigram)
+            if words is None:
+                return set()
+            word_sets.append(words)
+        
+        word_sets.sort(key=len)
+        candidates = word_sets[0].intersection(*word_sets[1:])
+        return {word for word in candidates if fragment in word}
+
+
 class DocumentManager:
-    """Менеджер для работы с документами"""
+    """
+    Менеджер для работы с документами
+
+    Документы хранятся в снимке (файл индекса) и журнале изменений в формате
+    JSON Lines рядом с ним: каждое добавление, обновление или удаление дописывает
+    в журнал одну строку. При загрузке журнал применяется поверх снимка, а когда
+    журнал становится вдвое больше снимка, снимок перезаписывается целиком
+    и журнал очищается.
+
+    Содержимое документов лежит отдельно, в файле содержимого: снимок и журнал
+    хранят только смещения, а текст читается из отображенного в память файла
+    при обращении к Document.content.
+    """
+    
+    # Журнал меньше этого размера не сжимается, даже если снимок еще меньше
+    COMPACT_MIN_LOG_SIZE = 1 << 20
+    # Файл содержимого сжимается, когда место удаленных документов превышает
+    # живое содержимое и этот размер
+    COMPACT_MIN_GARBAGE_SIZE = 1 << 20
     
     def __init__(self, data_dir: str = "data", index_file: str = "documents.json"):
         self.data_dir = Path(data_dir)
         self.index_file = self.data_dir / index_file
+        self.log_file = self.index_file.with_suffix('.jsonl')
+        self.contents_file = self.index_file.with_suffix('.bin')
+        self._snapshot_tmp_file = self.index_file.with_suffix(self.index_file.suffix + '.tmp')
+        self._contents_tmp_file = self.contents_file.with_suffix(self.contents_file.suffix + '.tmp')
+        self._finish_compaction()
+        self._contents = _ContentStore(self.contents_file)
+        # Размер живого содержимого в файле содержимого (остальное - место удаленных)
+        self._live_content_size = 0
         self.documents: Dict[str, Document] = {}
+        # Суммарная длина содержимого документов (поддерживается при изменениях)
+        self._total_chars = 0
+        # Индекс содержимого для проверки дубликатов: хэш содержимого -> doc_id
+        self._content_hashes: Dict[bytes, str] = {}
+        # Индекс заголовков: триграммы слов, слово -> doc_id документов
+        # и порядковые номера документов (результаты выдаются в порядке добавления)
+        self._title_trigrams = _TitleTrigrams()
+        self._title_words: Dict[str, Set[str]] = {}
+        self._title_order: Dict[str, int] = {}
+        self._title_counter = 0
+        # Общая строка заголовков в нижнем регистре через разделитель, начала
+        # заголовков в ней и документы в том же порядке (строится при первом
+        # сканировании после изменения документов)
+        self._titles_blob: Optional[str] = None
+        self._title_offsets: List[int] = []
+        self._title_docs: List[Document] = []
+        # Журнал открывается при первой записи; размер снимка нужен для решения о сжатии.
+        # Размеры снимка и журнала на диске поддерживаются при записи (для статистики)
+        self._log_fp = None
+        self._snapshot_size = 0
+        self._log_size = 0
+        # Вложенность batch() и наличие записей журнала, еще не сброшенных на диск
+        self._batch_depth = 0
+        self._dirty = False
         self._ensure_data_dir()
         self._load_documents()
+        # Несброшенные записи журнала сохраняются при завершении интерпретатора
+        atexit.register(_flush_at_exit, weakref.ref(self))
     
     def _ensure_data_dir(self):
         """Создание директории для данных если она не существует"""
         self.data_dir.mkdir(exist_ok=True)
     
     def _load_documents(self):
-        """Загрузка документов из файла индекса"""
-        if self.index_file.exists():
-            try:
-                with open(self.index_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for doc_data in data.get('documents', []):
-                        doc = Document.from_dict(doc_data)
-                        self.documents[doc.doc_id] = doc
-                print(f"Загружено {len(self.documents)} документов")
-            except Exception as e:
-                print(f"Ошибка при загрузке документов: {e}")
-                self.documents = {}
-    
-    def _save_documents(self):
-        """Сохранение документов в файл индекса"""
+        """Загрузка документов из снимка и журнала изменений"""
+        if not self.index_file.exists() and not self.log_file.exists():
+            return
+        
         try:
-            data = {
-                'documents': [doc.to_dict() for doc in self.documents.values()],
-                'last_updated': datetime.now().isoformat()
-            }
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            if self.index_file.exists():
+                for doc_data in _iter_snapshot_documents(self.index_file):
+                    doc = Document.from_dict(doc_data, self._contents, lower_title=False)
+                    self.documents[doc.doc_id] = doc
+                self._snapshot_size = self.index_file.stat().st_size
+            if self.log_file.exists():
+                self._log_size = self.log_file.stat().st_size
+                self._replay_log()
+            self._total_chars = sum(doc.content_len for doc in self.documents.values())
+            self._live_content_size = sum(doc._size for doc in self.documents.values())
+            self._content_hashes = self._build_content_hashes()
+            titles_blob = self._lower_titles()
+            for doc in self.documents.values():
+                self._index_title(doc)
+            if titles_blob is not None:
+                self._set_titles_blob(titles_blob)
+            logger.info("Загружено %d документов", len(self.documents))
         except Exception as e:
-            print(f"Ошибка при сохранении документов: {e}")
+            logger.error("Ошибка при загрузке документов: %s", e)
+            self.documents = {}
+            self._total_chars = 0
+            self._live_content_size = 0
+            self._content_hashes = {}
+            self._title_trigrams = _TitleTrigrams()
+            self._title_words = {}
+            self._title_order = {}
+            self._titles_blob = None
+    
+    def _build_content_hashes(self) -> Dict[bytes, str]:
+        """
+        Индекс хэшей содержимого загруженных документов
+
+        Хэши берутся из записей снимка и журнала. Содержимое читается и хэшируется
+        только для записей прежнего формата, без хэша; hashlib отпускает GIL при
+        хэшировании больших блоков, поэтому на больших корпусах такие хэши
+        считаются частями в пуле потоков.
+        """
+        content_hashes: Dict[bytes, str] = {}
+        unhashed: List[Document] = []
+        for doc in self.documents.values():
+            if doc.content_hash is None:
+                unhashed.append(doc)
+            else:
+                content_hashes[doc.content_hash] = doc.doc_id
+        if not unhashed:
+            return content_hashes
+        
+        if len(unhashed) < PARALLEL_LOAD_THRESHOLD:
+            chunks = [unhashed]
+            hashed = [_hash_documents(unhashed)]
+        else:
+            workers = os.cpu_count() or 1
+            chunk_size = -(-len(unhashed) // (workers * 4))
+            chunks = [unhashed[start:start + chunk_size] for start in range(0, len(unhashed), chunk_size)]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                hashed = list(executor.map(_hash_documents, chunks))
+        for chunk, hashes in zip(chunks, hashed):
+            for doc, content_hash in zip(chunk, hashes):
+                doc.content_hash = content_hash
+                content_hashes[content_hash] = doc.doc_id
+        return content_hashes
+    
+    def _lower_titles(self) -> Optional[str]:
+        """
+        Заголовки в нижнем регистре для всех загруженных документов
+
+        Заголовки соединяются через разделитель, и регистр меняется одним вызовом
+        str.lower для всей строки. Полученная строка - это и общая строка
+        заголовков для сканирования (возвращается; None, если пришлось считать
+        по документу).
+        """
+        documents = list(self.documents.values())
+        titles_blob = _TITLE_SEPARATOR.join(doc.title for doc in documents).lower()
+        titles = titles_blob.split(_TITLE_SEPARATOR)
+        if len(titles) != len(documents):
+            # Разделитель встречается в каком-то заголовке
+            for doc in documents:
+                doc.title_lower = doc.title.lower()
+            return None
+        
+        for doc, title_lower in zip(documents, titles):
+            doc.title_lower = title_lower
+        return titles_blob
+    
+    def _replay_log(self):
+        """Применение записей журнала изменений к загруженным документам"""
+        with open(self.log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Недописанная строка (например, после аварийного завершения)
+                    continue
+                
+                op = event.get('op')
+                if op == 'add':
+                    doc = Document.from_dict(event['doc'], self._contents, lower_title=False)
+                    self.documents[doc.doc_id] = doc
+                elif op == 'update':
+                    # Записи прежнего формата: обработанное содержимое в журнале
+                    doc = self.documents.get(event['doc_id'])
+                    if doc is not None:
+                        doc.set_processed_content(event['processed_content'])
+                elif op == 'delete':
+                    self.documents.pop(event['doc_id'], None)
+    
+    def _append_log(self, event: Dict[str, Any]):
+        """Запись изменения в журнал (вне batch() - сразу со сбросом на диск)"""
+        try:
+            if self._log_fp is None:
+                self._log_fp = open(self.log_file, 'a', encoding='utf-8', buffering=1 << 16)
+            self._log_fp.write(_encode_json(event) + "\n")
+            self._dirty = True
+        except Exception as e:
+            logger.error("Ошибка при сохранении документов: %s", e)
+            return
+        
+        if not self._batch_depth:
+            self.flush()
+    
+    @contextmanager
+    def batch(self):
+        """
+        Группировка изменений документов
+
+        Внутри блока записи журнала накапливаются в буфере, а сброс на диск
+        и проверка необходимости сжатия выполняются один раз при выходе:
+
+            with manager.batch():
+                for title, content in items:
+                    manager.add_document(title, content)
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+    
+    def flush(self):
+        """Сброс журнала на диск (и сжатие журнала, если он разросся)"""
+        if not self._dirty or self._log_fp is None:
+            return
+        
+        try:
+            self._log_fp.flush()
+            self._dirty = False
+            self._log_size = self._log_fp.tell()
+            garbage_size = self._contents.size - self._live_content_size
+            if (self._log_size > max(2 * self._snapshot_size, self.COMPACT_MIN_LOG_SIZE)
+                    or garbage_size > max(self._live_content_size, self.COMPACT_MIN_GARBAGE_SIZE)):
+                self.compact()
+        except Exception as e:
+            logger.error("Ошибка при сохранении документов: %s", e)
+    
+    def _finish_compaction(self):
+        """
+        Завершение сжатия, прерванного после подмены снимка
+
+        Новый файл содержимого пишется после временного снимка, а снимок подменяется
+        первым. Поэтому новый файл содержимого без временного снимка означает, что
+        снимок уже ссылается на него: сжатие доводится до конца. Иначе прежние
+        файлы согласованы, и недописанный файл содержимого удаляется.
+        """
+        if not self._contents_tmp_file.exists():
+            return
+        if self._snapshot_tmp_file.exists():
+            self._contents_tmp_file.unlink()
+            return
+        os.replace(self._contents_tmp_file, self.contents_file)
+        open(self.log_file, 'w', encoding='utf-8').close()
+    
+    def _save_documents(self, relocate_contents: bool = False):
+        """
+        Сохранение документов в файл индекса (снимок)
+
+        При relocate_contents живое содержимое переписывается подряд в новый файл
+        содержимого, и снимок ссылается на новые смещения (см. _finish_compaction).
+        """
+        committed = False
+        try:
+            # Содержимое, еще хранящееся строкой (снимок старого формата), переносится в файл
+            for doc in self.documents.values():
+                if doc._store is None:
+                    self._store_content(doc, doc.content_bytes())
+            self._contents.sync()
+            
+            # Новые смещения содержимого известны заранее: документы идут подряд
+            stored = [doc for doc in self.documents.values() if doc._store is not None]
+            offsets: Dict[str, int] = {}
+            if relocate_contents:
+                offset = 0
+                for doc in stored:
+                    offsets[doc.doc_id] = offset
+                    offset += doc._size
+            
+            # Снимок пишется во временный файл и подменяет прежний атомарно:
+            # сбой во время записи не повреждает единственную копию.
+            # Записи кодируются по документу отдельным вызовом кодировщика на C,
+            # без общего списка словарей и общей строки
+            tmp_file = self._snapshot_tmp_file
+            with open(tmp_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                f.write('{"documents":[')
+                separator = ''
+                for doc in self.documents.values():
+                    record = doc._to_record()
+                    if doc.doc_id in offsets:
+                        record['content_offset'] = offsets[doc.doc_id]
+                    f.write(separator)
+                    f.write(_encode_json(record))
+                    separator = ','
+                f.write('],"last_updated":' + _encode_json(_now_iso()) + '}')
+                snapshot_size = f.tell()
+                f.flush()
+                os.fsync(f.fileno())
+            if relocate_contents:
+                self._contents.write_compacted(self._contents_tmp_file, stored)
+            os.replace(tmp_file, self.index_file)
+            committed = True
+            self._snapshot_size = snapshot_size
+            if relocate_contents:
+                self._contents.replace(self._contents_tmp_file, stored,
+                                       [offsets[doc.doc_id] for doc in stored])
+            return True
+        except Exception as e:
+            logger.error("Ошибка при сохранении документов: %s", e)
+            if not committed and self._contents_tmp_file.exists():
+                self._contents_tmp_file.unlink()
+            return False
+    
+    def compact(self):
+        """
+        Перезапись снимка текущими документами и очистка журнала изменений
+
+        Место удаленных документов в файле содержимого освобождается.
+        """
+        # Журнал очищается только после записи снимка: записи журнала ссылаются
+        # на прежние смещения содержимого и к новому снимку не применяются
+        relocate_contents = self._contents.size > self._live_content_size
+        if not self._save_documents(relocate_contents):
+            return
+        if self._log_fp is not None:
+            self._log_fp.close()
+            self._log_fp = None
+        self._dirty = False
+        open(self.log_file, 'w', encoding='utf-8').close()
+        self._log_size = 0
+    
+    def close(self):
+        """Закрытие журнала изменений и файла содержимого"""
+        self.flush()
+        if self._log_fp is not None:
+            self._log_fp.close()
+            self._log_fp = None
+        self._contents.close()
+    
+    def _store_content(self, doc: Document, data: bytes):
+        """Запись содержимого документа в файл содержимого"""
+        compressed = False
+        if len(data) >= CONTENT_COMPRESS_MIN_SIZE:
+            packed = zlib.compress(data, CONTENT_COMPRESSION_LEVEL)
+            if len(packed) < len(data):
+                data = packed
+                compressed = True
+        doc._attach_content(self._contents, self._contents.append(data), len(data), compressed)
+        self._live_content_size += len(data)
     
     def add_document(self, title: str, content: str, 
                     file_path: Optional[str] = None, 
                     metadata: Optional[Dict] = None) -> str:
         """Добавление нового документа"""
-        doc_id = f"doc_{len(self.documents) + 1}_{hash(content) % 10000}"
-        
-        # Проверяем, не существует ли уже такой документ
-        for existing_doc in self.documents.values():
-            if existing_doc.content == content:
-                print(f"Документ с таким содержимым уже существует: {existing_doc.doc_id}")
-                return existing_doc.doc_id
-        
+        # Содержимое кодируется один раз: те же байты идут в хэш и в файл содержимого
         doc = Document(
-            doc_id=doc_id,
+            doc_id="",
             title=title,
             content=content,
             file_path=file_path,
             metadata=metadata
         )
+        data = doc.content_bytes()
+        content_hash = _content_hash(data)
+        
+        # Проверяем, не существует ли уже такой документ
+        existing_id = self._content_hashes.get(content_hash)
+        if existing_id is not None:
+            logger.debug("Документ с таким содержимым уже существует: %s", existing_id)
+            return existing_id
+        
+        # Идентификатор выводится из хэша содержимого и не зависит от запуска
+        doc_id = f"doc_{len(self.documents) + 1}_{content_hash.hex()[:8]}"
+        doc.doc_id = doc_id
+        doc.content_hash = content_hash
         
         self.documents[doc_id] = doc
-        self._save_documents()
-        print(f"Добавлен документ: {doc_id}")
+        self._total_chars += doc.content_len
+        self._content_hashes[content_hash] = doc_id
+        self._index_title(doc)
+        try:
+            self._store_content(doc, data)
+        except Exception as e:
+            # Документ остается с содержимым в памяти и сохраняется в журнале целиком
+            logger.error("Ошибка при сохранении содержимого документа: %s", e)
+        self._append_log({'op': 'add', 'doc': doc._to_record()})
+        logger.debug("Добавлен документ: %s", doc_id)
         return doc_id
     
     def get_document(self, doc_id: str) -> Optional[Document]:
@@ -122,40 +734,236 @@ class DocumentManager:
         """Получение всех документов"""
         return list(self.documents.values())
     
-    def update_document_content(self, doc_id: str, processed_content: str):
-        """Обновление обработанного содержимого документа"""
-        if doc_id in self.documents:
-            self.documents[doc_id].processed_content = processed_content
-            self._save_documents()
+    def update_document_content(self, doc_id: str, processed_content: str,
+                                tokens: Optional[Sequence[str]] = None):
+        """
+        Обновление обработанного содержимого документа (и кэша его слов)
+
+        Обработанное содержимое выводится из содержимого и в журнал не пишется.
+        """
+        doc = self.documents.get(doc_id)
+        if doc is not None:
+            doc.set_processed_content(processed_content, tokens)
     
     def delete_document(self, doc_id: str) -> bool:
         """Удаление документа"""
         if doc_id in self.documents:
-            del self.documents[doc_id]
-            self._save_documents()
-            print(f"Документ {doc_id} удален")
+            doc = self.documents.pop(doc_id)
+            self._total_chars -= doc.content_len
+            content_hash = doc.content_hash
+            if content_hash is None:
+                content_hash = _content_hash(doc.content_bytes())
+            self._content_hashes.pop(content_hash, None)
+            if doc._store is not None:
+                # Место содержимого освобождается при сжатии, а удаленный документ может
+                # оставаться в результатах поиска: его содержимое переносится в память
+                self._live_content_size -= doc._size
+                doc._content = doc.content_bytes()
+                doc._store = None
+            self._unindex_title(doc)
+            self._append_log({'op': 'delete', 'doc_id': doc_id})
+            logger.debug("Документ %s удален", doc_id)
             return True
         return False
     
     def search_by_title(self, query: str) -> List[Document]:
         """Поиск документов по заголовку"""
         query_lower = query.lower()
+        
+        # Запрос без слов или с короткими словами совпадает со многими заголовками:
+        # все заголовки просматриваются одним сканированием общей строки
+        fragments = query_lower.split()
+        fragment = max(fragments, key=len) if fragments else ''
+        if len(fragment) < TITLE_INDEX_MIN_FRAGMENT:
+            return self._scan_titles(query_lower)
+        
+        # Самый длинный фрагмент запроса входит в одно из слов заголовка:
+        # кандидаты берутся из индекса, а совпадение проверяется по заголовку
+        candidates: Set[str] = set()
+        for word in self._title_trigrams.words_containing(fragment):
+            candidates.update(self._title_words[word])
+        
+        results = [self.documents[doc_id] for doc_id in candidates
+                   if query_lower in self.documents[doc_id].title_lower]
+        results.sort(key=lambda doc: self._title_order[doc.doc_id])
+        return results
+    
+    def _scan_titles(self, query_lower: str) -> List[Document]:
+        """Поиск подстроки в заголовках сканированием общей строки заголовков"""
+        if _TITLE_SEPARATOR in query_lower:
+            return [doc for doc in self.documents.values() if query_lower in doc.title_lower]
+        
+        if self._titles_blob is None:
+            self._set_titles_blob(_TITLE_SEPARATOR.join(doc.title_lower for doc in self.documents.values()))
+        if not self._title_docs:
+            # Пустая строка заголовков: пустой запрос нашелся бы в ней без заголовка
+            return []
+        
+        # Поиск идет в C (str.find), номер заголовка по позиции находится bisect;
+        # после совпадения сканирование продолжается со следующего заголовка
+        blob = self._titles_blob
+        offsets = self._title_offsets
         results = []
-        for doc in self.documents.values():
-            if query_lower in doc.title.lower():
+        pos = blob.find(query_lower)
+        while pos != -1:
+            index = bisect_right(offsets, pos) - 1
+            doc = self._title_docs[index]
+            title_end = offsets[index] + len(doc.title_lower)
+            if pos + len(query_lower) <= title_end:
                 results.append(doc)
+                pos = title_end + 1
+            else:
+                # Совпадение через разделитель (заголовок содержит \x00) не считается
+                pos += 1
+            if pos > len(blob):
+                break
+            pos = blob.find(query_lower, pos)
         return results
     
+    def _set_titles_blob(self, titles_blob: str):
+        """Установка общей строки заголовков (заголовки документов в порядке добавления)"""
+        self._title_docs = list(self.documents.values())
+        self._title_offsets = []
+        offset = 0
+        for doc in self._title_docs:
+            self._title_offsets.append(offset)
+            offset += len(doc.title_lower) + 1
+        self._titles_blob = titles_blob
+    
+    def _index_title(self, doc: Document):
+        """Добавление заголовка документа в индекс заголовков"""
+        self._titles_blob = None
+        self._title_counter += 1
+        self._title_order[doc.doc_id] = self._title_counter
+        for word in set(doc.title_lower.split()):
+            doc_ids = self._title_words.get(word)
+            if doc_ids is None:
+                doc_ids = self._title_words[word] = set()
+                self._title_trigrams.add(word)
+            doc_ids.add(doc.doc_id)
+    
+    def _unindex_title(self, doc: Document):
+        """Удаление заголовка документа из индекса заголовков"""
+        self._titles_blob = None
+        self._title_order.pop(doc.doc_id, None)
+        for word in set(doc.title_lower.split()):
+            doc_ids = self._title_words.get(word)
+            if doc_ids is None:
+                continue
+            doc_ids.discard(doc.doc_id)
+            if not doc_ids:
+                del self._title_words[word]
+                self._title_trigrams.remove(word)
+    
     def get_stats(self) -> Dict[str, Any]:
         """Получение статистики по документам"""
         total_docs = len(self.documents)
-        total_chars = sum(len(doc.content) for doc in self.documents.values())
+        total_chars = self._total_chars
         avg_chars = total_chars / total_docs if total_docs > 0 else 0
         
         return {
             'total_documents': total_docs,
             'total_characters': total_chars,
             'average_characters_per_document': avg_chars,
-            'index_file_size': self.index_file.stat().st_size if self.index_file.exists() else 0
+            # Снимок, журнал и файл содержимого вместе; размеры запоминаются при загрузке
+            # и записи, без обращения к файловой системе
+            'index_file_size': self._snapshot_size + self._log_size + self._contents.size
         }
 
+
+def _intern_short(value: Any) -> Any:
+    """Интернирование короткой строки (повторяющиеся значения хранятся одним объектом)"""
+    if isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def _intern_metadata(metadata: Optional[Dict]) -> Optional[Dict]:
+    """Метаданные с интернированными ключами и короткими строковыми значениями"""
+    if not metadata:
+        return metadata
+    return {sys.intern(key) if isinstance(key, str) else key: _intern_short(value)
+            for key, value in metadata.items()}
+
+
+# Последняя отформатированная секунда и ее строка (см. _now_iso)
+_now_cache: Tuple[int, str] = (-1, "")
+
+
+def _now_iso() -> str:
+    """
+    Текущее локальное время в ISO-формате с точностью до секунды
+
+    Используется для отметки времени записи снимка: строка форматируется один
+    раз в секунду без построения datetime. Время создания документов хранится
+    с микросекундами (datetime.isoformat) и через этот кэш не идет.
+    """
+    global _now_cache
+    second = int(time.time())
+    cached_second, cached = _now_cache
+    if second != cached_second:
+        cached = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second))
+        _now_cache = (second, cached)
+    return cached
+
+
+def _flush_at_exit(manager_ref: 'weakref.ref[DocumentManager]'):
+    """Сброс журнала менеджера при завершении интерпретатора (если менеджер еще существует)"""
+    manager = manager_ref()
+    if manager is not None:
+        manager.flush()
+
+
+def _trigrams(word: str) -> Set[str]:
+    """Различные триграммы слова"""
+    return {word[start:start + 3] for start in range(len(word) - 2)}
+
+
+def _content_hash(data: bytes) -> bytes:
+    """Хэш закодированного содержимого документа (blake2b, 16 байт)"""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _hash_documents(documents: List[Document]) -> List[bytes]:
+    """Хэши содержимого документов (выполняется в пуле потоков)"""
+    return [_content_hash(doc.content_bytes()) for doc in documents]
+
+
+def _iter_snapshot_documents(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Потоковое чтение документов из снимка
+
+    Файл читается блоками, и документы разбираются по одному через
+    JSONDecoder.raw_decode, поэтому в памяти не строится весь снимок целиком.
+    Снимок с другим порядком ключей разбирается целиком.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(SNAPSHOT_READ_SIZE)
+        head = _SNAPSHOT_HEAD_RE.match(buffer)
+        if head is None:
+            data = json.loads(buffer + f.read())
+            yield from data.get('documents', [])
+            return
+        
+        pos = head.end()
+        while True:
+            pos = _SEPARATORS_RE.match(buffer, pos).end()
+            if pos < len(buffer):
+                if buffer[pos] == ']':
+                    return
+                try:
+                    doc_data, pos = decoder.raw_decode(buffer, pos)
+                    yield doc_data
+                    continue
+                except ValueError:
+                    # Документ не уместился в прочитанную часть - дочитываем ниже
+                    pass
+            
+            # Блок растет вместе с буфером, чтобы большой документ не разбирался
+            # заново после каждого маленького дочитывания
+            chunk = f.read(max(SNAPSHOT_READ_SIZE, len(buffer) - pos))
+            if not chunk:
+                raise ValueError("Снимок документов обрывается внутри массива documents")
+            buffer = buffer[pos:] + chunk
+            pos = 0